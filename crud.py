@@ -1,12 +1,13 @@
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import selectinload, joinedload
+from sqlalchemy.orm import selectinload, joinedload, aliased
 import logging
-from sqlalchemy import text
+from sqlalchemy import text, bindparam
 from sqlalchemy import select
 
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple
 from datetime import datetime
 from sqlalchemy import select, func, or_, and_, desc
+from itertools import groupby
 
 from models import (
     Team, 
@@ -21,6 +22,9 @@ from models import (
 
 logger = logging.getLogger(__name__)
 
+# Tamanho do lote ao ler resultados grandes com cursor no servidor
+SNAPSHOT_ROWS_YIELD_PER = 500
+
 # ===== TEAMS =====
 
 async def list_teams(db: AsyncSession) -> List[Team]:
@@ -165,21 +169,53 @@ async def list_tournaments(db: AsyncSession) -> List[Tournament]:
 
 # ===== RANKING =====
 
+_LATEST_SNAPSHOT_STMT = (
+    select(RankingSnapshot)
+    .order_by(RankingSnapshot.created_at.desc())
+    .limit(1)
+)
+
 async def get_latest_ranking_snapshot(db: AsyncSession) -> Optional[RankingSnapshot]:
     """Busca o snapshot de ranking mais recente"""
     try:
-        query = (
-            select(RankingSnapshot)
-            .order_by(RankingSnapshot.created_at.desc())
-            .limit(1)
-        )
-        
-        result = await db.execute(query)
+        result = await db.execute(_LATEST_SNAPSHOT_STMT)
         return result.scalar_one_or_none()
     except Exception as e:
         logger.error(f"Erro ao buscar snapshot: {str(e)}")
         return None
 
+# Snapshot anterior com a mesma definição usada em _RANKING_WITH_VARIATIONS_SQL
+# (id menor, mais recente por created_at), resolvido na mesma linha do último
+_PreviousSnapshot = aliased(RankingSnapshot)
+_LATEST_SNAPSHOT_WITH_PREVIOUS_STMT = (
+    select(
+        RankingSnapshot,
+        select(_PreviousSnapshot.id)
+        .where(_PreviousSnapshot.id < RankingSnapshot.id)
+        .order_by(_PreviousSnapshot.created_at.desc())
+        .limit(1)
+        .correlate(RankingSnapshot)
+        .scalar_subquery()
+        .label("previous_id"),
+    )
+    .order_by(RankingSnapshot.created_at.desc())
+    .limit(1)
+)
+
+async def get_latest_ranking_snapshot_with_previous(
+    db: AsyncSession
+) -> Tuple[Optional[RankingSnapshot], Optional[int]]:
+    """Busca o snapshot mais recente e o ID do snapshot usado nas variações"""
+    try:
+        result = await db.execute(_LATEST_SNAPSHOT_WITH_PREVIOUS_STMT)
+        row = result.first()
+        if not row:
+            return None, None
+        return row[0], row.previous_id
+    except Exception as e:
+        logger.error(f"Erro ao buscar snapshot: {str(e)}")
+        return None, None
+
 async def get_ranking_by_snapshot(
     db: AsyncSession, 
     snapshot_id: int, 
@@ -221,22 +257,22 @@ async def get_ranking_snapshots(
         logger.error(f"Erro ao buscar snapshots: {str(e)}")
         return []
     
+_RANKING_SNAPSHOTS_SQL = text("""
+    SELECT 
+        id, 
+        created_at, 
+        total_matches, 
+        total_teams, 
+        snapshot_metadata
+    FROM ranking_snapshots
+    ORDER BY created_at DESC
+    LIMIT :limit
+""")
+
 async def get_ranking_snapshots_raw(db: AsyncSession, limit: int = 10) -> List[dict]:
     """Lista os snapshots de ranking usando SQL raw (compatível com pgbouncer)"""
     try:
-        query = text("""
-            SELECT 
-                id, 
-                created_at, 
-                total_matches, 
-                total_teams, 
-                snapshot_metadata
-            FROM ranking_snapshots
-            ORDER BY created_at DESC
-            LIMIT :limit
-        """)
-        
-        result = await db.execute(query, {"limit": limit})
+        result = await db.execute(_RANKING_SNAPSHOTS_SQL, {"limit": limit})
         rows = result.fetchall()
         
         snapshots = []
@@ -254,39 +290,39 @@ async def get_ranking_snapshots_raw(db: AsyncSession, limit: int = 10) -> List[d
         logger.error(f"Erro ao buscar snapshots (raw): {str(e)}")
         return []
 
+_RANKING_BY_SNAPSHOT_SQL = text("""
+    SELECT 
+        rh.position,
+        rh.team_id,
+        rh.nota_final::float8 as nota_final,
+        rh.ci_lower::float8 as ci_lower,
+        rh.ci_upper::float8 as ci_upper,
+        rh.incerteza::float8 as incerteza,
+        rh.games_count,
+        rh.score_colley::float8 as score_colley,
+        rh.score_massey::float8 as score_massey,
+        rh.score_elo_final::float8 as score_elo_final,
+        rh.score_elo_mov::float8 as score_elo_mov,
+        rh.score_trueskill::float8 as score_trueskill,
+        rh.score_pagerank::float8 as score_pagerank,
+        rh.score_bradley_terry::float8 as score_bradley_terry,
+        rh.score_pca::float8 as score_pca,
+        rh.score_sos::float8 as score_sos,
+        rh.score_consistency::float8 as score_consistency,
+        rh.score_integrado::float8 as score_integrado,
+        t.name as team_name,
+        t.tag as team_tag,
+        t.org as team_org
+    FROM ranking_history rh
+    JOIN teams t ON rh.team_id = t.id
+    WHERE rh.snapshot_id = :snapshot_id
+    ORDER BY rh.position
+""")
+
 async def get_ranking_by_snapshot_raw(db: AsyncSession, snapshot_id: int) -> List[dict]:
     """Busca o ranking de um snapshot usando SQL raw"""
     try:
-        query = text("""
-            SELECT 
-                rh.position,
-                rh.team_id,
-                rh.nota_final,
-                rh.ci_lower,
-                rh.ci_upper,
-                rh.incerteza,
-                rh.games_count,
-                rh.score_colley,
-                rh.score_massey,
-                rh.score_elo_final,
-                rh.score_elo_mov,
-                rh.score_trueskill,
-                rh.score_pagerank,
-                rh.score_bradley_terry,
-                rh.score_pca,
-                rh.score_sos,
-                rh.score_consistency,
-                rh.score_integrado,
-                t.name as team_name,
-                t.tag as team_tag,
-                t.org as team_org
-            FROM ranking_history rh
-            JOIN teams t ON rh.team_id = t.id
-            WHERE rh.snapshot_id = :snapshot_id
-            ORDER BY rh.position
-        """)
-        
-        result = await db.execute(query, {"snapshot_id": snapshot_id})
+        result = await db.execute(_RANKING_BY_SNAPSHOT_SQL, {"snapshot_id": snapshot_id})
         rows = result.fetchall()
         
         rankings = []
@@ -297,23 +333,23 @@ async def get_ranking_by_snapshot_raw(db: AsyncSession, snapshot_id: int) -> Lis
                 "team_name": row.team_name,
                 "team_tag": row.team_tag,
                 "team_org": row.team_org,
-                "nota_final": float(row.nota_final),
-                "ci_lower": float(row.ci_lower),
-                "ci_upper": float(row.ci_upper),
-                "incerteza": float(row.incerteza),
+                "nota_final": row.nota_final,
+                "ci_lower": row.ci_lower,
+                "ci_upper": row.ci_upper,
+                "incerteza": row.incerteza,
                 "games_count": row.games_count,
                 "scores": {
-                    "colley": float(row.score_colley or 0),
-                    "massey": float(row.score_massey or 0),
-                    "elo": float(row.score_elo_final or 0),
-                    "elo_mov": float(row.score_elo_mov or 0),
-                    "trueskill": float(row.score_trueskill or 0),
-                    "pagerank": float(row.score_pagerank or 0),
-                    "bradley_terry": float(row.score_bradley_terry or 0),
-                    "pca": float(row.score_pca or 0),
-                    "sos": float(row.score_sos or 0),
-                    "consistency": float(row.score_consistency or 0),
-                    "integrado": float(row.score_integrado or 0)
+                    "colley": row.score_colley or 0.0,
+                    "massey": row.score_massey or 0.0,
+                    "elo": row.score_elo_final or 0.0,
+                    "elo_mov": row.score_elo_mov or 0.0,
+                    "trueskill": row.score_trueskill or 0.0,
+                    "pagerank": row.score_pagerank or 0.0,
+                    "bradley_terry": row.score_bradley_terry or 0.0,
+                    "pca": row.score_pca or 0.0,
+                    "sos": row.score_sos or 0.0,
+                    "consistency": row.score_consistency or 0.0,
+                    "integrado": row.score_integrado or 0.0
                 }
             })
         
@@ -322,19 +358,115 @@ async def get_ranking_by_snapshot_raw(db: AsyncSession, snapshot_id: int) -> Lis
         logger.error(f"Erro ao buscar ranking (raw): {str(e)}")
         return []
 
+_SNAPSHOT_WITH_RANKING_SQL = text("""
+    SELECT 
+        rs.id as snapshot_id,
+        rs.created_at,
+        rs.total_teams,
+        rs.total_matches,
+        rs.snapshot_metadata,
+        rh.position,
+        rh.team_id,
+        rh.nota_final::float8 as nota_final,
+        rh.ci_lower::float8 as ci_lower,
+        rh.ci_upper::float8 as ci_upper,
+        rh.incerteza::float8 as incerteza,
+        rh.games_count,
+        rh.score_colley::float8 as score_colley,
+        rh.score_massey::float8 as score_massey,
+        rh.score_elo_final::float8 as score_elo_final,
+        rh.score_elo_mov::float8 as score_elo_mov,
+        rh.score_trueskill::float8 as score_trueskill,
+        rh.score_pagerank::float8 as score_pagerank,
+        rh.score_bradley_terry::float8 as score_bradley_terry,
+        rh.score_pca::float8 as score_pca,
+        rh.score_sos::float8 as score_sos,
+        rh.score_consistency::float8 as score_consistency,
+        rh.score_integrado::float8 as score_integrado,
+        t.name as team_name,
+        t.tag as team_tag,
+        t.org as team_org
+    FROM ranking_snapshots rs
+    LEFT JOIN (
+        ranking_history rh
+        JOIN teams t ON rh.team_id = t.id
+    ) ON rh.snapshot_id = rs.id
+    WHERE rs.id = :snapshot_id
+    ORDER BY rh.position
+""")
+
+async def get_snapshot_with_ranking_raw(db: AsyncSession, snapshot_id: int) -> Optional[dict]:
+    """
+    Busca os dados de um snapshot e o seu ranking em uma única query (SQL raw).
+    Retorna None se o snapshot não existe; erros de banco são propagados.
+    """
+    try:
+        result = await db.execute(_SNAPSHOT_WITH_RANKING_SQL, {"snapshot_id": snapshot_id})
+        rows = result.fetchall()
+        
+        # Nenhuma linha: o snapshot não existe
+        if not rows:
+            return None
+        
+        first = rows[0]
+        snapshot = {
+            "id": first.snapshot_id,
+            "created_at": first.created_at,
+            "total_teams": first.total_teams,
+            "total_matches": first.total_matches,
+            "metadata": first.snapshot_metadata or {},
+            "ranking": []
+        }
+        
+        for row in rows:
+            # Snapshot sem histórico vem com uma única linha de colunas nulas
+            if row.team_id is None:
+                continue
+            snapshot["ranking"].append({
+                "position": row.position,
+                "team_id": row.team_id,
+                "team_name": row.team_name,
+                "team_tag": row.team_tag,
+                "team_org": row.team_org,
+                "nota_final": row.nota_final,
+                "ci_lower": row.ci_lower,
+                "ci_upper": row.ci_upper,
+                "incerteza": row.incerteza,
+                "games_count": row.games_count,
+                "scores": {
+                    "colley": row.score_colley or 0.0,
+                    "massey": row.score_massey or 0.0,
+                    "elo": row.score_elo_final or 0.0,
+                    "elo_mov": row.score_elo_mov or 0.0,
+                    "trueskill": row.score_trueskill or 0.0,
+                    "pagerank": row.score_pagerank or 0.0,
+                    "bradley_terry": row.score_bradley_terry or 0.0,
+                    "pca": row.score_pca or 0.0,
+                    "sos": row.score_sos or 0.0,
+                    "consistency": row.score_consistency or 0.0,
+                    "integrado": row.score_integrado or 0.0
+                }
+            })
+        
+        return snapshot
+    except Exception as e:
+        # Propaga a falha: None significa apenas "snapshot não existe" (404)
+        logger.error(f"Erro ao buscar snapshot com ranking (raw): {str(e)}")
+        raise
+
 # Adicione estas funções no crud.py
 
+_PREVIOUS_SNAPSHOT_STMT = (
+    select(RankingSnapshot)
+    .order_by(RankingSnapshot.created_at.desc())
+    .offset(1)  # Pula o mais recente
+    .limit(1)
+)
+
 async def get_previous_ranking_snapshot(db: AsyncSession) -> Optional[RankingSnapshot]:
     """Busca o penúltimo snapshot de ranking para calcular variações"""
     try:
-        query = (
-            select(RankingSnapshot)
-            .order_by(RankingSnapshot.created_at.desc())
-            .offset(1)  # Pula o mais recente
-            .limit(1)
-        )
-        
-        result = await db.execute(query)
+        result = await db.execute(_PREVIOUS_SNAPSHOT_STMT)
         return result.scalar_one_or_none()
     except Exception as e:
         logger.error(f"Erro ao buscar snapshot anterior: {str(e)}")
@@ -370,7 +502,7 @@ async def get_ranking_with_variations(
         for prev_rank in previous_rankings:
             previous_data[prev_rank.team_id] = {
                 'position': prev_rank.position,
-                'nota_final': float(prev_rank.nota_final)
+                'nota_final': prev_rank.nota_final
             }
         
         # Calcular variações
@@ -386,7 +518,7 @@ async def get_ranking_with_variations(
                 prev_nota = previous_data[rank.team_id]['nota_final']
                 
                 variacao = prev_position - rank.position  # Positivo se subiu
-                variacao_nota = float(rank.nota_final) - prev_nota
+                variacao_nota = rank.nota_final - prev_nota
             else:
                 # Time novo no ranking
                 is_new = True
@@ -448,61 +580,69 @@ async def get_team_players_complete(db: AsyncSession, team_id: int) -> List[dict
         return []
 
 # Versão alternativa usando SQL raw para melhor performance
-async def get_ranking_with_variations_raw(db: AsyncSession, snapshot_id: int) -> List[dict]:
-    """Versão otimizada usando SQL raw para calcular variações"""
+_RANKING_WITH_VARIATIONS_SQL = text("""
+    WITH current_ranking AS (
+        SELECT 
+            rh.position,
+            rh.team_id,
+            rh.nota_final::float8 as nota_final,
+            rh.ci_lower::float8 as ci_lower,
+            rh.ci_upper::float8 as ci_upper,
+            rh.incerteza::float8 as incerteza,
+            rh.games_count,
+            rh.score_colley::float8 as score_colley,
+            rh.score_massey::float8 as score_massey,
+            rh.score_elo_final::float8 as score_elo_final,
+            rh.score_elo_mov::float8 as score_elo_mov,
+            rh.score_trueskill::float8 as score_trueskill,
+            rh.score_pagerank::float8 as score_pagerank,
+            rh.score_bradley_terry::float8 as score_bradley_terry,
+            rh.score_pca::float8 as score_pca,
+            rh.score_sos::float8 as score_sos,
+            rh.score_consistency::float8 as score_consistency,
+            rh.score_integrado::float8 as score_integrado,
+            t.name as team_name,
+            t.tag as team_tag,
+            t.org as team_org
+        FROM ranking_history rh
+        JOIN teams t ON rh.team_id = t.id
+        WHERE rh.snapshot_id = :current_snapshot_id
+    ),
+    previous_ranking AS (
+        SELECT 
+            rh.position as prev_position,
+            rh.team_id,
+            rh.nota_final as prev_nota_final
+        FROM ranking_history rh
+        WHERE rh.snapshot_id = (
+            SELECT id FROM ranking_snapshots 
+            WHERE id < :current_snapshot_id
+            ORDER BY created_at DESC 
+            LIMIT 1
+        )
+    )
+    SELECT 
+        cr.*,
+        COALESCE(pr.prev_position - cr.position, 0) as variacao,
+        COALESCE(cr.nota_final - pr.prev_nota_final, 0) as variacao_nota,
+        CASE WHEN pr.team_id IS NULL THEN true ELSE false END as is_new
+    FROM current_ranking cr
+    LEFT JOIN previous_ranking pr ON cr.team_id = pr.team_id
+    ORDER BY cr.position
+    LIMIT :limit
+""")
+
+async def get_ranking_with_variations_raw(
+    db: AsyncSession,
+    snapshot_id: int,
+    limit: Optional[int] = None
+) -> List[dict]:
+    """
+    Versão otimizada usando SQL raw para calcular variações.
+    O limite é aplicado no banco (LIMIT NULL retorna todas as linhas).
+    """
     try:
-        query = text("""
-            WITH current_ranking AS (
-                SELECT 
-                    rh.position,
-                    rh.team_id,
-                    rh.nota_final,
-                    rh.ci_lower,
-                    rh.ci_upper,
-                    rh.incerteza,
-                    rh.games_count,
-                    rh.score_colley,
-                    rh.score_massey,
-                    rh.score_elo_final,
-                    rh.score_elo_mov,
-                    rh.score_trueskill,
-                    rh.score_pagerank,
-                    rh.score_bradley_terry,
-                    rh.score_pca,
-                    rh.score_sos,
-                    rh.score_consistency,
-                    rh.score_integrado,
-                    t.name as team_name,
-                    t.tag as team_tag,
-                    t.org as team_org
-                FROM ranking_history rh
-                JOIN teams t ON rh.team_id = t.id
-                WHERE rh.snapshot_id = :current_snapshot_id
-            ),
-            previous_ranking AS (
-                SELECT 
-                    rh.position as prev_position,
-                    rh.team_id,
-                    rh.nota_final as prev_nota_final
-                FROM ranking_history rh
-                WHERE rh.snapshot_id = (
-                    SELECT id FROM ranking_snapshots 
-                    WHERE id < :current_snapshot_id
-                    ORDER BY created_at DESC 
-                    LIMIT 1
-                )
-            )
-            SELECT 
-                cr.*,
-                COALESCE(pr.prev_position - cr.position, 0) as variacao,
-                COALESCE(cr.nota_final - pr.prev_nota_final, 0) as variacao_nota,
-                CASE WHEN pr.team_id IS NULL THEN true ELSE false END as is_new
-            FROM current_ranking cr
-            LEFT JOIN previous_ranking pr ON cr.team_id = pr.team_id
-            ORDER BY cr.position
-        """)
-        
-        result = await db.execute(query, {"current_snapshot_id": snapshot_id})
+        result = await db.execute(_RANKING_WITH_VARIATIONS_SQL, {"current_snapshot_id": snapshot_id, "limit": limit})
         rows = result.fetchall()
         
         rankings = []
@@ -513,26 +653,26 @@ async def get_ranking_with_variations_raw(db: AsyncSession, snapshot_id: int) ->
                 "team_name": row.team_name,
                 "team_tag": row.team_tag,
                 "team_org": row.team_org,
-                "nota_final": float(row.nota_final),
-                "ci_lower": float(row.ci_lower),
-                "ci_upper": float(row.ci_upper),
-                "incerteza": float(row.incerteza),
+                "nota_final": row.nota_final,
+                "ci_lower": row.ci_lower,
+                "ci_upper": row.ci_upper,
+                "incerteza": row.incerteza,
                 "games_count": row.games_count,
                 "variacao": int(row.variacao),
-                "variacao_nota": float(row.variacao_nota),
+                "variacao_nota": row.variacao_nota,
                 "is_new": bool(row.is_new),
                 "scores": {
-                    "colley": float(row.score_colley or 0),
-                    "massey": float(row.score_massey or 0),
-                    "elo": float(row.score_elo_final or 0),
-                    "elo_mov": float(row.score_elo_mov or 0),
-                    "trueskill": float(row.score_trueskill or 0),
-                    "pagerank": float(row.score_pagerank or 0),
-                    "bradley_terry": float(row.score_bradley_terry or 0),
-                    "pca": float(row.score_pca or 0),
-                    "sos": float(row.score_sos or 0),
-                    "consistency": float(row.score_consistency or 0),
-                    "integrado": float(row.score_integrado or 0)
+                    "colley": row.score_colley or 0.0,
+                    "massey": row.score_massey or 0.0,
+                    "elo": row.score_elo_final or 0.0,
+                    "elo_mov": row.score_elo_mov or 0.0,
+                    "trueskill": row.score_trueskill or 0.0,
+                    "pagerank": row.score_pagerank or 0.0,
+                    "bradley_terry": row.score_bradley_terry or 0.0,
+                    "pca": row.score_pca or 0.0,
+                    "sos": row.score_sos or 0.0,
+                    "consistency": row.score_consistency or 0.0,
+                    "integrado": row.score_integrado or 0.0
                 }
             })
         
@@ -541,6 +681,52 @@ async def get_ranking_with_variations_raw(db: AsyncSession, snapshot_id: int) ->
         logger.error(f"Erro ao buscar ranking com variações (raw): {str(e)}")
         return []
 
+_RANKING_WITH_VARIATIONS_BETWEEN_SNAPSHOTS_SQL = text("""
+    WITH current_ranking AS (
+        SELECT 
+            rh.position,
+            rh.team_id,
+            rh.nota_final::float8 as nota_final,
+            rh.ci_lower::float8 as ci_lower,
+            rh.ci_upper::float8 as ci_upper,
+            rh.incerteza::float8 as incerteza,
+            rh.games_count,
+            rh.score_colley::float8 as score_colley,
+            rh.score_massey::float8 as score_massey,
+            rh.score_elo_final::float8 as score_elo_final,
+            rh.score_elo_mov::float8 as score_elo_mov,
+            rh.score_trueskill::float8 as score_trueskill,
+            rh.score_pagerank::float8 as score_pagerank,
+            rh.score_bradley_terry::float8 as score_bradley_terry,
+            rh.score_pca::float8 as score_pca,
+            rh.score_sos::float8 as score_sos,
+            rh.score_consistency::float8 as score_consistency,
+            rh.score_integrado::float8 as score_integrado,
+            t.name as team_name,
+            t.tag as team_tag,
+            t.org as team_org
+        FROM ranking_history rh
+        JOIN teams t ON rh.team_id = t.id
+        WHERE rh.snapshot_id = :current_snapshot_id
+    ),
+    previous_ranking AS (
+        SELECT 
+            rh.position as prev_position,
+            rh.team_id,
+            rh.nota_final as prev_nota_final
+        FROM ranking_history rh
+        WHERE rh.snapshot_id = :previous_snapshot_id
+    )
+    SELECT 
+        cr.*,
+        COALESCE(pr.prev_position - cr.position, 0) as variacao,
+        COALESCE(cr.nota_final - pr.prev_nota_final, 0) as variacao_nota,
+        CASE WHEN pr.team_id IS NULL THEN true ELSE false END as is_new
+    FROM current_ranking cr
+    LEFT JOIN previous_ranking pr ON cr.team_id = pr.team_id
+    ORDER BY cr.position
+""")
+
 async def get_ranking_with_variations_between_snapshots_raw(
     db: AsyncSession, 
     current_snapshot_id: int,
@@ -548,53 +734,7 @@ async def get_ranking_with_variations_between_snapshots_raw(
 ) -> List[dict]:
     """Calcula variações entre dois snapshots específicos"""
     try:
-        query = text("""
-            WITH current_ranking AS (
-                SELECT 
-                    rh.position,
-                    rh.team_id,
-                    rh.nota_final,
-                    rh.ci_lower,
-                    rh.ci_upper,
-                    rh.incerteza,
-                    rh.games_count,
-                    rh.score_colley,
-                    rh.score_massey,
-                    rh.score_elo_final,
-                    rh.score_elo_mov,
-                    rh.score_trueskill,
-                    rh.score_pagerank,
-                    rh.score_bradley_terry,
-                    rh.score_pca,
-                    rh.score_sos,
-                    rh.score_consistency,
-                    rh.score_integrado,
-                    t.name as team_name,
-                    t.tag as team_tag,
-                    t.org as team_org
-                FROM ranking_history rh
-                JOIN teams t ON rh.team_id = t.id
-                WHERE rh.snapshot_id = :current_snapshot_id
-            ),
-            previous_ranking AS (
-                SELECT 
-                    rh.position as prev_position,
-                    rh.team_id,
-                    rh.nota_final as prev_nota_final
-                FROM ranking_history rh
-                WHERE rh.snapshot_id = :previous_snapshot_id
-            )
-            SELECT 
-                cr.*,
-                COALESCE(pr.prev_position - cr.position, 0) as variacao,
-                COALESCE(cr.nota_final - pr.prev_nota_final, 0) as variacao_nota,
-                CASE WHEN pr.team_id IS NULL THEN true ELSE false END as is_new
-            FROM current_ranking cr
-            LEFT JOIN previous_ranking pr ON cr.team_id = pr.team_id
-            ORDER BY cr.position
-        """)
-        
-        result = await db.execute(query, {
+        result = await db.execute(_RANKING_WITH_VARIATIONS_BETWEEN_SNAPSHOTS_SQL, {
             "current_snapshot_id": current_snapshot_id,
             "previous_snapshot_id": previous_snapshot_id
         })
@@ -608,30 +748,183 @@ async def get_ranking_with_variations_between_snapshots_raw(
                 "team_name": row.team_name,
                 "team_tag": row.team_tag,
                 "team_org": row.team_org,
-                "nota_final": float(row.nota_final),
-                "ci_lower": float(row.ci_lower),
-                "ci_upper": float(row.ci_upper),
-                "incerteza": float(row.incerteza),
+                "nota_final": row.nota_final,
+                "ci_lower": row.ci_lower,
+                "ci_upper": row.ci_upper,
+                "incerteza": row.incerteza,
                 "games_count": row.games_count,
                 "variacao": int(row.variacao),
-                "variacao_nota": round(float(row.variacao_nota), 2),
+                "variacao_nota": round(row.variacao_nota, 2),
                 "is_new": bool(row.is_new),
                 "scores": {
-                    "colley": float(row.score_colley or 0),
-                    "massey": float(row.score_massey or 0),
-                    "elo": float(row.score_elo_final or 0),
-                    "elo_mov": float(row.score_elo_mov or 0),
-                    "trueskill": float(row.score_trueskill or 0),
-                    "pagerank": float(row.score_pagerank or 0),
-                    "bradley_terry": float(row.score_bradley_terry or 0),
-                    "pca": float(row.score_pca or 0),
-                    "sos": float(row.score_sos or 0),
-                    "consistency": float(row.score_consistency or 0),
-                    "integrado": float(row.score_integrado or 0)
+                    "colley": row.score_colley or 0.0,
+                    "massey": row.score_massey or 0.0,
+                    "elo": row.score_elo_final or 0.0,
+                    "elo_mov": row.score_elo_mov or 0.0,
+                    "trueskill": row.score_trueskill or 0.0,
+                    "pagerank": row.score_pagerank or 0.0,
+                    "bradley_terry": row.score_bradley_terry or 0.0,
+                    "pca": row.score_pca or 0.0,
+                    "sos": row.score_sos or 0.0,
+                    "consistency": row.score_consistency or 0.0,
+                    "integrado": row.score_integrado or 0.0
                 }
             })
         
         return rankings
     except Exception as e:
         logger.error(f"Erro ao calcular variações entre snapshots: {str(e)}")
-        return []
\ No newline at end of file
+        return []
+
+_RANKINGS_WITH_VARIATIONS_FOR_SNAPSHOTS_SQL = text("""
+    WITH snaps AS (
+        SELECT 
+            id,
+            LAG(id) OVER (ORDER BY created_at) as prev_snapshot_id
+        FROM ranking_snapshots
+        WHERE id IN :snapshot_ids
+    )
+    SELECT 
+        rh.snapshot_id,
+        rh.position,
+        rh.team_id,
+        rh.nota_final::float8 as nota_final,
+        rh.ci_lower::float8 as ci_lower,
+        rh.ci_upper::float8 as ci_upper,
+        rh.incerteza::float8 as incerteza,
+        rh.games_count,
+        rh.score_colley::float8 as score_colley,
+        rh.score_massey::float8 as score_massey,
+        rh.score_elo_final::float8 as score_elo_final,
+        rh.score_elo_mov::float8 as score_elo_mov,
+        rh.score_trueskill::float8 as score_trueskill,
+        rh.score_pagerank::float8 as score_pagerank,
+        rh.score_bradley_terry::float8 as score_bradley_terry,
+        rh.score_pca::float8 as score_pca,
+        rh.score_sos::float8 as score_sos,
+        rh.score_consistency::float8 as score_consistency,
+        rh.score_integrado::float8 as score_integrado,
+        t.name as team_name,
+        t.tag as team_tag,
+        t.org as team_org,
+        COALESCE(pr.position - rh.position, 0) as variacao,
+        COALESCE(rh.nota_final - pr.nota_final, 0)::float8 as variacao_nota,
+        CASE WHEN pr.team_id IS NULL THEN true ELSE false END as is_new
+    FROM snaps s
+    JOIN ranking_history rh ON rh.snapshot_id = s.id
+    JOIN teams t ON rh.team_id = t.id
+    LEFT JOIN ranking_history pr
+        ON pr.snapshot_id = s.prev_snapshot_id
+       AND pr.team_id = rh.team_id
+    ORDER BY rh.snapshot_id, rh.position
+""").bindparams(
+    bindparam("snapshot_ids", expanding=True)
+).execution_options(yield_per=SNAPSHOT_ROWS_YIELD_PER)
+
+async def get_rankings_with_variations_for_snapshots_raw(
+    db: AsyncSession,
+    snapshot_ids: List[int]
+) -> Dict[int, List[dict]]:
+    """
+    Busca o ranking de vários snapshots em uma única query, com as variações
+    de cada snapshot em relação ao snapshot imediatamente anterior da lista.
+    O pareamento é feito no banco com LAG() sobre a data de criação.
+    """
+    if not snapshot_ids:
+        return {}
+
+    try:
+        # Com vários snapshots o resultado pode ter milhares de linhas: usa
+        # cursor no servidor e processa em lotes em vez de bufferizar tudo
+        result = await db.stream(_RANKINGS_WITH_VARIATIONS_FOR_SNAPSHOTS_SQL, {"snapshot_ids": list(snapshot_ids)})
+
+        rankings_by_snapshot: Dict[int, List[dict]] = {
+            snapshot_id: [] for snapshot_id in snapshot_ids
+        }
+        async for row in result:
+            rankings_by_snapshot[row.snapshot_id].append({
+                "position": row.position,
+                "team_id": row.team_id,
+                "team_name": row.team_name,
+                "team_tag": row.team_tag,
+                "team_org": row.team_org,
+                "nota_final": row.nota_final,
+                "ci_lower": row.ci_lower,
+                "ci_upper": row.ci_upper,
+                "incerteza": row.incerteza,
+                "games_count": row.games_count,
+                "variacao": int(row.variacao),
+                "variacao_nota": round(row.variacao_nota, 2),
+                "is_new": bool(row.is_new),
+                "scores": {
+                    "colley": row.score_colley or 0.0,
+                    "massey": row.score_massey or 0.0,
+                    "elo": row.score_elo_final or 0.0,
+                    "elo_mov": row.score_elo_mov or 0.0,
+                    "trueskill": row.score_trueskill or 0.0,
+                    "pagerank": row.score_pagerank or 0.0,
+                    "bradley_terry": row.score_bradley_terry or 0.0,
+                    "pca": row.score_pca or 0.0,
+                    "sos": row.score_sos or 0.0,
+                    "consistency": row.score_consistency or 0.0,
+                    "integrado": row.score_integrado or 0.0
+                }
+            })
+
+        return rankings_by_snapshot
+    except Exception as e:
+        logger.error(f"Erro ao buscar rankings dos snapshots (raw): {str(e)}")
+        return {}
+
+_TEAMS_HISTORY_STMT = (
+    select(
+        RankingHistory.team_id,
+        RankingHistory.snapshot_id,
+        RankingSnapshot.created_at,
+        RankingHistory.position,
+        RankingHistory.nota_final,
+        RankingHistory.incerteza,
+        RankingHistory.games_count,
+    )
+    .join(RankingSnapshot, RankingSnapshot.id == RankingHistory.snapshot_id)
+    .where(RankingHistory.team_id.in_(bindparam("team_ids")))
+    .order_by(RankingHistory.team_id, RankingSnapshot.created_at.desc())
+)
+
+async def get_teams_history_batch(db: AsyncSession, team_ids: List[int]) -> Dict[int, List[dict]]:
+    """
+    Busca a evolução no ranking de vários times em uma única consulta,
+    agrupada por time (snapshots do mais recente para o mais antigo).
+    """
+    history_by_team: Dict[int, List[dict]] = {team_id: [] for team_id in team_ids}
+    if not team_ids:
+        return history_by_team
+
+    try:
+        result = await db.execute(_TEAMS_HISTORY_STMT, {"team_ids": list(team_ids)})
+
+        # Os times compartilham os mesmos snapshots: formata cada data uma única vez
+        created_at_iso: Dict[int, Optional[str]] = {}
+
+        def snapshot_iso(row) -> Optional[str]:
+            if row.snapshot_id not in created_at_iso:
+                created_at_iso[row.snapshot_id] = row.created_at.isoformat() if row.created_at else None
+            return created_at_iso[row.snapshot_id]
+
+        for team_id, rows in groupby(result, key=lambda r: r.team_id):
+            history_by_team[team_id] = [
+                {
+                    "snapshot_id": row.snapshot_id,
+                    "created_at": snapshot_iso(row),
+                    "position": row.position,
+                    "nota_final": row.nota_final,
+                    "incerteza": row.incerteza,
+                    "games_count": row.games_count,
+                }
+                for row in rows
+            ]
+
+        return history_by_team
+    except Exception as e:
+        logger.error(f"Erro ao buscar histórico dos times: {str(e)}")
+        return history_by_team
@@ -1,13 +1,13 @@
 import os
 import asyncio
 from datetime import datetime, timezone
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Tuple
 import logging
-from functools import wraps
+from functools import wraps, lru_cache
 
 from fastapi import FastAPI, Depends, HTTPException, Query, Path, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import PlainTextResponse, JSONResponse
+from fastapi.responses import PlainTextResponse, JSONResponse, Response
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 
@@ -69,6 +69,40 @@ async def global_exception_handler(request, exc):
         }
     )
 
+# ===== CACHE DO RANKING =====
+# O ranking publicado depende do snapshot mais recente e do anterior (base das
+# variações). Guardamos o JSON já serializado da resposta, por limite, com a
+# chave (último, anterior): snapshots excluídos ou importados por fora deste
+# processo mudam a chave e invalidam o cache sozinhos. Criação e exclusão pela
+# API também limpam o cache. Nome, tag e org dos times são lidos de `teams` no
+# momento em que a resposta entra no cache e ficam congelados até o próximo
+# snapshot: a API não edita times, então após alterá-los direto no banco chame
+# POST /ranking/refresh. O serviço roda com um único worker (ver Dockerfile).
+RANKING_CACHE_MAX_ENTRIES = 32
+
+_ranking_cache: Dict[str, Any] = {"key": None, "bodies": {}}
+
+def get_cached_ranking(key: Tuple[int, Optional[int]], limit: Optional[int]) -> Optional[bytes]:
+    """Retorna o JSON em cache do par (último, anterior)/limite, se houver"""
+    if _ranking_cache["key"] != key:
+        return None
+    return _ranking_cache["bodies"].get(limit)
+
+def set_cached_ranking(key: Tuple[int, Optional[int]], limit: Optional[int], body: bytes) -> None:
+    """Guarda o JSON do par (último, anterior)/limite, descartando o de outro par"""
+    if (
+        _ranking_cache["key"] != key
+        or len(_ranking_cache["bodies"]) >= RANKING_CACHE_MAX_ENTRIES
+    ):
+        _ranking_cache["key"] = key
+        _ranking_cache["bodies"] = {}
+    _ranking_cache["bodies"][limit] = body
+
+def clear_ranking_cache() -> None:
+    """Invalida o cache do ranking"""
+    _ranking_cache["key"] = None
+    _ranking_cache["bodies"] = {}
+
 # ===== HELPER FUNCTIONS =====
 
 def format_team_dict(team: Team) -> dict:
@@ -100,7 +134,71 @@ def format_team_dict(team: Team) -> dict:
         "twitch": team.twitch or ""
     }
 
-def format_match_dict(match: Match) -> dict:
+@lru_cache(maxsize=4096)
+def format_tournament_date(value: Optional[datetime]) -> Optional[str]:
+    """ISO das datas de torneio (imutáveis e repetidas em toda lista de partidas)"""
+    return value.isoformat() if value else None
+
+def format_tournament_dict(tournament: Tournament) -> dict:
+    """
+    Formata um torneio para o formato esperado pelo front-end
+    IMPORTANTE: Mapeia 'start_date' -> 'startsOn' e 'end_date' -> 'endsOn'
+    """
+    return {
+        "id": tournament.id,
+        "name": tournament.name,
+        "logo": tournament.logo or "",
+        "organizer": tournament.organizer or "",
+        "startsOn": format_tournament_date(tournament.start_date),
+        "endsOn": format_tournament_date(tournament.end_date)
+    }
+
+def format_team_match_info(tmi: Optional[TeamMatchInfo], tmi_id: str, team: Optional[dict], fallback_score: int) -> dict:
+    """
+    Formata o lado de um time na partida (tmi_a/tmi_b)
+    IMPORTANTE: usa 'agent_1' até 'agent_5', não 'agent1'
+    """
+    if tmi is None:
+        return {
+            "id": tmi_id,
+            "team": team,
+            "score": fallback_score,
+            "agent_1": "",
+            "agent_2": "",
+            "agent_3": "",
+            "agent_4": "",
+            "agent_5": "",
+        }
+    
+    return {
+        "id": tmi_id,
+        "team": team,
+        "score": tmi.score,
+        "agent_1": tmi.agent1 or "",
+        "agent_2": tmi.agent2 or "",
+        "agent_3": tmi.agent3 or "",
+        "agent_4": tmi.agent4 or "",
+        "agent_5": tmi.agent5 or "",
+    }
+
+def format_cached(cache: Optional[dict], obj: Any, formatter) -> dict:
+    """
+    Formata obj com formatter, reaproveitando o dict já montado para o mesmo id
+    dentro de uma resposta (times e torneios se repetem entre partidas)
+    """
+    if cache is None:
+        return formatter(obj)
+    
+    formatted = cache.get(obj.id)
+    if formatted is None:
+        formatted = cache[obj.id] = formatter(obj)
+    return formatted
+
+def format_match_dict(
+    match: Match,
+    teams_cache: Optional[dict] = None,
+    tournaments_cache: Optional[dict] = None
+) -> dict:
     """Formata uma partida para o formato esperado pelo front-end"""
     
     # Log para debug em desenvolvimento
@@ -113,26 +211,19 @@ def format_match_dict(match: Match) -> dict:
     
     # Usar team_match_info se disponível, senão usar teams diretos
     if match.tmi_a_rel and match.tmi_a_rel.team:
-        team_a = format_team_dict(match.tmi_a_rel.team)
+        team_a = format_cached(teams_cache, match.tmi_a_rel.team, format_team_dict)
     elif match.team_i_obj:
-        team_a = format_team_dict(match.team_i_obj)
+        team_a = format_cached(teams_cache, match.team_i_obj, format_team_dict)
     
     if match.tmi_b_rel and match.tmi_b_rel.team:
-        team_b = format_team_dict(match.tmi_b_rel.team)
+        team_b = format_cached(teams_cache, match.tmi_b_rel.team, format_team_dict)
     elif match.team_j_obj:
-        team_b = format_team_dict(match.team_j_obj)
+        team_b = format_cached(teams_cache, match.team_j_obj, format_team_dict)
     
     # Formatar torneio
     tournament = None
     if match.tournament_rel:
-        tournament = {
-            "id": match.tournament_rel.id,
-            "name": match.tournament_rel.name,
-            "logo": match.tournament_rel.logo or "",
-            "organizer": match.tournament_rel.organizer or "",
-            "startsOn": match.tournament_rel.start_date.isoformat() if match.tournament_rel.start_date else None,
-            "endsOn": match.tournament_rel.end_date.isoformat() if match.tournament_rel.end_date else None
-        }
+        tournament = format_cached(tournaments_cache, match.tournament_rel, format_tournament_dict)
     
     # Combinar data e hora
     match_datetime = datetime.combine(match.date, match.time)
@@ -142,31 +233,51 @@ def format_match_dict(match: Match) -> dict:
         "map": match.mapa or "",
         "round": match.fase or "",
         "date": match_datetime.isoformat(),
-        "tmi_a": {
-            "id": str(match.tmi_a) if match.tmi_a else f"{match.idPartida}_a",
-            "team": team_a,
-            "score": match.tmi_a_rel.score if match.tmi_a_rel else match.score_i,
-
-            "agent_1": (match.tmi_a_rel.agent1 or "") if match.tmi_a_rel else "",
-            "agent_2": (match.tmi_a_rel.agent2 or "") if match.tmi_a_rel else "",
-            "agent_3": (match.tmi_a_rel.agent3 or "") if match.tmi_a_rel else "",
-            "agent_4": (match.tmi_a_rel.agent4 or "") if match.tmi_a_rel else "",
-            "agent_5": (match.tmi_a_rel.agent5 or "") if match.tmi_a_rel else "",
-        },
-        "tmi_b": {
-            "id": str(match.tmi_b) if match.tmi_b else f"{match.idPartida}_b",
-            "team": team_b,
-            "score": match.tmi_b_rel.score if match.tmi_b_rel else match.score_j,
-
-            "agent_1": (match.tmi_b_rel.agent1 or "") if match.tmi_b_rel else "",
-            "agent_2": (match.tmi_b_rel.agent2 or "") if match.tmi_b_rel else "",
-            "agent_3": (match.tmi_b_rel.agent3 or "") if match.tmi_b_rel else "",
-            "agent_4": (match.tmi_b_rel.agent4 or "") if match.tmi_b_rel else "",
-            "agent_5": (match.tmi_b_rel.agent5 or "") if match.tmi_b_rel else "",
-        },
+        "tmi_a": format_team_match_info(
+            match.tmi_a_rel,
+            str(match.tmi_a) if match.tmi_a else f"{match.idPartida}_a",
+            team_a,
+            match.score_i
+        ),
+        "tmi_b": format_team_match_info(
+            match.tmi_b_rel,
+            str(match.tmi_b) if match.tmi_b else f"{match.idPartida}_b",
+            team_b,
+            match.score_j
+        ),
         "tournament": tournament
     }
 
+def format_matches(matches: List[Match]) -> List[dict]:
+    """Formata uma lista de partidas, montando cada time/torneio uma única vez"""
+    teams_cache: dict = {}
+    tournaments_cache: dict = {}
+    return [format_match_dict(match, teams_cache, tournaments_cache) for match in matches]
+
+def matches_response(matches: List[Match]) -> Response:
+    """Valida as partidas formatadas contra List[schemas.Match] e serializa o JSON"""
+    validated = schemas.MATCH_LIST_ADAPTER.validate_python(format_matches(matches))
+    return Response(content=schemas.MATCH_LIST_ADAPTER.dump_json(validated), media_type="application/json")
+
+def format_ranking_item(rank: dict) -> schemas.RankingItem:
+    """Monta um RankingItem a partir de uma linha do ranking vinda do banco"""
+    return schemas.build_ranking_item({
+        "posicao": rank["position"],
+        "team_id": rank["team_id"],
+        "team": rank["team_name"],
+        "tag": rank["team_tag"] or "",
+        "university": rank["team_org"] or "",
+        "nota_final": rank["nota_final"],
+        "ci_lower": rank["ci_lower"],
+        "ci_upper": rank["ci_upper"],
+        "incerteza": rank["incerteza"],
+        "games_count": rank["games_count"],
+        "variacao": rank["variacao"],
+        "variacao_nota": rank["variacao_nota"],
+        "is_new": rank["is_new"],
+        "scores": rank["scores"]
+    })
+
 # ===== ROOT E HEALTH =====
 
 @app.get("/")
@@ -271,7 +382,7 @@ async def get_team_matches(
         
         matches = await crud.get_team_matches(db, team_id, limit)
         
-        return [format_match_dict(match) for match in matches]
+        return matches_response(matches)
         
     except HTTPException:
         raise
@@ -287,7 +398,7 @@ async def list_matches(
     """Lista as partidas mais recentes"""
     try:
         matches = await crud.list_recent_matches(db, limit)
-        return [format_match_dict(match) for match in matches]
+        return matches_response(matches)
     except Exception as e:
         logger.error(f"Erro ao listar partidas: {str(e)}", exc_info=True)
         return []
@@ -299,10 +410,15 @@ async def get_ranking(
     limit: Optional[int] = Query(None, ge=1, le=1000),
     db: AsyncSession = Depends(get_db)
 ):
-    """Retorna o ranking atual com cálculo de variações"""
+    """
+    Retorna o ranking atual com cálculo de variações
+    A resposta fica em cache por (último, anterior snapshot): nome, tag e
+    universidade dos times refletem a tabela teams no momento do cache; após
+    editar times no banco, use POST /ranking/refresh
+    """
     try:
-        # Buscar último snapshot
-        snapshot = await crud.get_latest_ranking_snapshot(db)
+        # Buscar último snapshot (e o anterior, base das variações)
+        snapshot, previous_id = await crud.get_latest_ranking_snapshot_with_previous(db)
         
         if not snapshot:
             return {
@@ -313,40 +429,35 @@ async def get_ranking(
                 "ranking": []
             }
         
-        # Buscar ranking com variações usando SQL otimizado
-        rankings_with_variations = await crud.get_ranking_with_variations_raw(db, snapshot.id)
+        # Resposta inteira já serializada em cache: devolve os bytes direto
+        cache_key = (snapshot.id, previous_id)
+        body = get_cached_ranking(cache_key, limit)
+        if body is not None:
+            return Response(content=body, media_type="application/json")
         
-        # Aplicar limite se especificado
-        if limit:
-            rankings_with_variations = rankings_with_variations[:limit]
+        # Buscar ranking com variações usando SQL otimizado (limite aplicado no banco)
+        rankings_with_variations = await crud.get_ranking_with_variations_raw(db, snapshot.id, limit)
         
         # Formatar ranking
-        ranking_list = []
-        for rank in rankings_with_variations:
-            ranking_list.append({
-                "posicao": rank["position"],
-                "team_id": rank["team_id"],
-                "team": rank["team_name"],
-                "tag": rank["team_tag"] or "",
-                "university": rank["team_org"] or "",
-                "nota_final": rank["nota_final"],
-                "ci_lower": rank["ci_lower"],
-                "ci_upper": rank["ci_upper"],
-                "incerteza": rank["incerteza"],
-                "games_count": rank["games_count"],
-                "variacao": rank["variacao"],
-                "variacao_nota": rank["variacao_nota"],
-                "is_new": rank["is_new"],
-                "scores": rank["scores"]
-            })
+        ranking_list = [format_ranking_item(rank) for rank in rankings_with_variations]
         
-        return {
-            "cached": False,
-            "last_update": snapshot.created_at.isoformat(),
-            "limit": limit,
-            "total": len(ranking_list),
-            "ranking": ranking_list
-        }
+        response = schemas.build_ranking_response(
+            ranking_list,
+            last_update=snapshot.created_at.isoformat(),
+            limit=limit,
+            cached=False
+        )
+        
+        # As próximas requisições recebem a mesma resposta marcada como cached
+        if ranking_list:
+            set_cached_ranking(
+                cache_key,
+                limit,
+                response.model_copy(update={"cached": True}).model_dump_json().encode()
+            )
+        
+        # Serializa direto no pydantic-core, sem revalidar a resposta
+        return Response(content=response.model_dump_json(), media_type="application/json")
         
     except Exception as e:
         logger.error(f"Erro ao buscar ranking: {str(e)}", exc_info=True)
@@ -379,17 +490,31 @@ async def get_ranking_preview(
         if limit:
             ranking_now = ranking_now[:limit]
 
-        return {
-            "cached": False,
-            "last_update": datetime.now(timezone.utc).isoformat(),
-            "limit": limit,
-            "total": len(ranking_now),
-            "ranking": ranking_now,
-        }
+        response = schemas.build_ranking_response(
+            ranking_now,
+            last_update=datetime.now(timezone.utc).isoformat(),
+            limit=limit
+        )
+        return Response(content=response.model_dump_json(), media_type="application/json")
     except Exception as e:
         logger.error(f"Erro no preview do ranking: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="Erro ao gerar preview do ranking")
 
+@app.get("/ranking/teams/history")
+async def get_teams_ranking_history(
+    team_ids: List[int] = Query([], max_length=20),
+    db: AsyncSession = Depends(get_db)
+):
+    """Retorna a evolução no ranking de vários times (comparação lado a lado)"""
+    history_by_team = await crud.get_teams_history_batch(db, team_ids)
+
+    return {
+        "teams": [
+            {"team_id": team_id, "history": history}
+            for team_id, history in history_by_team.items()
+        ]
+    }
+
 @app.get("/ranking/snapshots")
 async def get_ranking_snapshots(
     limit: int = Query(10, ge=1, le=50),
@@ -404,8 +529,17 @@ async def get_ranking_snapshots(
         snapshots = await crud.get_ranking_snapshots_raw(db, limit)
         
         snapshots_data = []
-        
-        for i, snapshot in enumerate(snapshots):
+
+        # Rankings de todos os snapshots em uma única query; cada snapshot é
+        # comparado com o anterior da lista (o mais antigo não tem variações)
+        rankings_by_snapshot = {}
+        if include_full_data:
+            rankings_by_snapshot = await crud.get_rankings_with_variations_for_snapshots_raw(
+                db,
+                [snapshot["id"] for snapshot in snapshots]
+            )
+
+        for snapshot in snapshots:
             snapshot_info = {
                 "id": snapshot["id"],
                 "created_at": snapshot["created_at"].isoformat(),
@@ -415,29 +549,8 @@ async def get_ranking_snapshots(
             }
             
             if include_full_data:
-                # Para cada snapshot, calcular variações em relação ao anterior
-                rankings = []
-                
-                # Se não é o último snapshot (mais antigo), existe um anterior
-                if i < len(snapshots) - 1:
-                    # O snapshot anterior é o próximo na lista (snapshots[i+1])
-                    previous_snapshot_id = snapshots[i+1]["id"]
-                    
-                    # Buscar ranking com variações entre este snapshot e o anterior
-                    rankings = await crud.get_ranking_with_variations_between_snapshots_raw(
-                        db, 
-                        snapshot["id"], 
-                        previous_snapshot_id
-                    )
-                else:
-                    # É o snapshot mais antigo, não tem variações
-                    rankings = await crud.get_ranking_by_snapshot_raw(db, snapshot["id"])
-                    # Adicionar campos de variação zerados e is_new = True para todos
-                    for rank in rankings:
-                        rank["variacao"] = 0
-                        rank["variacao_nota"] = 0.0
-                        rank["is_new"] = True
-                
+                rankings = rankings_by_snapshot.get(snapshot["id"], [])
+
                 ranking_list = []
                 for rank in rankings:
                     ranking_list.append({
@@ -461,9 +574,10 @@ async def get_ranking_snapshots(
             
             snapshots_data.append(snapshot_info)
         
-        return {
+        # Os dados já são tipos JSON nativos: responde direto, sem jsonable_encoder
+        return JSONResponse(content={
             "data": snapshots_data
-        }
+        })
         
     except Exception as e:
         logger.error(f"Erro ao buscar snapshots: {str(e)}", exc_info=True)
@@ -476,11 +590,13 @@ async def get_ranking_snapshots(
 @app.post("/ranking/snapshot")
 async def create_ranking_snapshot(
     admin_key: str = Query(..., description="Chave de administração"),
+    force: bool = Query(False, description="Cria o snapshot mesmo sem partidas novas"),
     db: AsyncSession = Depends(get_db)
 ):
     """
     Cria um novo snapshot do ranking atual
     Requer chave de administração
+    Sem partidas novas desde o último snapshot, retorna o snapshot existente
     """
     # Validar chave admin
     if admin_key != os.getenv("ADMIN_KEY", "valorant2024admin"):
@@ -490,14 +606,22 @@ async def create_ranking_snapshot(
         from ranking_history import save_ranking_snapshot
         
         # Criar snapshot
-        snapshot_id = await save_ranking_snapshot(db)
+        snapshot_id, created = await save_ranking_snapshot(db, force=force)
         
         if not snapshot_id:
             raise HTTPException(status_code=500, detail="Erro ao criar snapshot")
         
+        # Só um snapshot novo muda o ranking publicado
+        if created:
+            clear_ranking_cache()
+        
         return {
             "snapshot_id": snapshot_id,
-            "message": "Snapshot criado com sucesso",
+            "created": created,
+            "message": (
+                "Snapshot criado com sucesso" if created
+                else "Nenhuma partida nova, snapshot existente mantido"
+            ),
             "timestamp": datetime.now(timezone.utc).isoformat()
         }
         
@@ -514,17 +638,14 @@ async def get_snapshot_details(
     Retorna detalhes completos de um snapshot específico
     """
     try:
-        # Buscar snapshot
-        snapshot = await db.get(RankingSnapshot, snapshot_id)
-        if not snapshot:
+        # Buscar snapshot e ranking em uma única query
+        snapshot = await crud.get_snapshot_with_ranking_raw(db, snapshot_id)
+        if snapshot is None:
             raise HTTPException(status_code=404, detail="Snapshot não encontrado")
         
-        # Buscar ranking do snapshot
-        rankings = await crud.get_ranking_by_snapshot_raw(db, snapshot_id)
-        
         # Formatar resposta
         ranking_list = []
-        for rank in rankings:
+        for rank in snapshot["ranking"]:
             ranking_list.append({
                 "posicao": rank["position"],
                 "team_id": rank["team_id"],
@@ -539,14 +660,15 @@ async def get_snapshot_details(
                 "scores": rank["scores"]
             })
         
-        return {
-            "id": snapshot.id,
-            "created_at": snapshot.created_at.isoformat(),
-            "total_teams": snapshot.total_teams,
-            "total_matches": snapshot.total_matches,
-            "metadata": snapshot.snapshot_metadata or {},
+        # Os dados já são tipos JSON nativos: responde direto, sem jsonable_encoder
+        return JSONResponse(content={
+            "id": snapshot["id"],
+            "created_at": snapshot["created_at"].isoformat(),
+            "total_teams": snapshot["total_teams"],
+            "total_matches": snapshot["total_matches"],
+            "metadata": snapshot["metadata"],
             "ranking": ranking_list
-        }
+        })
         
     except HTTPException:
         raise
@@ -600,6 +722,7 @@ async def delete_ranking_snapshot(
         # Excluir snapshot
         await db.delete(snapshot)
         await db.commit()
+        clear_ranking_cache()
         
         return {
             "message": f"Snapshot #{snapshot_id} excluído com sucesso",
@@ -624,8 +747,8 @@ async def refresh_ranking_cache(
     if secret_key != os.getenv("RANKING_REFRESH_KEY", "valorant2024ranking"):
         raise HTTPException(status_code=403, detail="Chave inválida")
     
-    # Como não estamos usando cache real, apenas retorna sucesso
-    # Em produção, aqui você limparia o cache Redis/Memcached
+    clear_ranking_cache()
+    
     return {
         "message": "Cache atualizado",
         "timestamp": datetime.now(timezone.utc).isoformat()
@@ -637,10 +760,15 @@ async def get_api_info(db: AsyncSession = Depends(get_db)):
     Retorna informações sobre a API
     """
     try:
-        # Contar dados
-        teams_count = await db.execute(select(func.count(Team.id)))
-        matches_count = await db.execute(select(func.count(Match.idPartida)))
-        snapshots_count = await db.execute(select(func.count(RankingSnapshot.id)))
+        # Contar dados (as três contagens em uma única query)
+        counts_result = await db.execute(
+            select(
+                select(func.count(Team.id)).scalar_subquery().label("teams"),
+                select(func.count(Match.idPartida)).scalar_subquery().label("matches"),
+                select(func.count(RankingSnapshot.id)).scalar_subquery().label("snapshots"),
+            )
+        )
+        counts = counts_result.one()
         
         # Buscar último snapshot
         latest_snapshot = await crud.get_latest_ranking_snapshot(db)
@@ -673,9 +801,9 @@ async def get_api_info(db: AsyncSession = Depends(get_db)):
                 "environment": "production" if IS_PRODUCTION else "development"
             },
             "stats": {
-                "teams": teams_count.scalar(),
-                "matches": matches_count.scalar(),
-                "snapshots": snapshots_count.scalar()
+                "teams": counts.teams,
+                "matches": counts.matches,
+                "snapshots": counts.snapshots
             },
             "features": {
                 "ranking_available": latest_snapshot is not None,
@@ -712,17 +840,7 @@ async def list_tournaments(db: AsyncSession = Depends(get_db)):
     try:
         tournaments = await crud.list_tournaments(db)
         
-        return [
-            {
-                "id": t.id,
-                "name": t.name,
-                "logo": t.logo or "",
-                "organizer": t.organizer or "",
-                "startsOn": t.start_date.isoformat() if t.start_date else None,
-                "endsOn": t.end_date.isoformat() if t.end_date else None
-            }
-            for t in tournaments
-        ]
+        return [format_tournament_dict(t) for t in tournaments]
         
     except Exception as e:
         logger.error(f"Erro ao listar torneios: {str(e)}", exc_info=True)
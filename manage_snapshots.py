@@ -2,6 +2,7 @@ import json
 import os
 import platform
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
 from pathlib import Path
 from typing import Any, Dict, List, Optional
@@ -153,7 +154,10 @@ def capture_new_snapshot() -> None:
         if not snap_id:
             print(f"⚠️ Resposta sem snapshot_id: {meta}")
             return
-        print(f"\n✅ Snapshot #{snap_id} criado!")
+        if meta.get("created", True):
+            print(f"\n✅ Snapshot #{snap_id} criado!")
+        else:
+            print(f"\nℹ️  {meta.get('message')} (#{snap_id})")
         full = fetch_snapshot_details(int(snap_id))
         save_snapshot_file(full)
     except requests.HTTPError as e:
@@ -309,9 +313,12 @@ def test_connection() -> bool:
     """Ping na API + /info para checar estado geral."""
     print("\n🔌 Testando conexão…")
     try:
-        resp = SESSION.get(f"{API_URL}/health", timeout=TIMEOUT_SHORT)
+        # /health e /info são independentes: dispara as duas em paralelo
+        with ThreadPoolExecutor(max_workers=2) as ex:
+            health_f = ex.submit(SESSION.get, f"{API_URL}/health", timeout=TIMEOUT_SHORT)
+            info_f = ex.submit(SESSION.get, f"{API_URL}/info", timeout=TIMEOUT_SHORT)
+            resp, info_resp = health_f.result(), info_f.result()
         resp.raise_for_status()
-        info_resp = SESSION.get(f"{API_URL}/info", timeout=TIMEOUT_SHORT)
         info_resp.raise_for_status()
         info = info_resp.json()
         print(
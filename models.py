@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, Date, Time, SmallInteger, DateTime, JSON, Numeric, Boolean
+from sqlalchemy import Column, Integer, String, ForeignKey, Date, Time, SmallInteger, DateTime, JSON, Numeric, Boolean, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.sql import func
@@ -167,6 +167,11 @@ class Match(Base):
 
 class RankingSnapshot(Base):
     __tablename__ = "ranking_snapshots"
+    __table_args__ = (
+        # Busca do snapshot mais recente e listagens por data (ORDER BY created_at)
+        # viram index-only scan. DDL em sql/ranking_snapshots_indexes.sql
+        Index("ranking_snapshots_created_at_id_idx", "created_at", "id"),
+    )
     
     id = Column(Integer, primary_key=True)
     created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
@@ -179,29 +184,44 @@ class RankingSnapshot(Base):
 
 class RankingHistory(Base):
     __tablename__ = "ranking_history"
+    __table_args__ = (
+        # Índice de cobertura para as leituras por snapshot (ordenadas por posição):
+        # permite index-only scan sem visitar o heap. DDL em sql/ranking_history_indexes.sql
+        Index(
+            "ranking_history_snapshot_covering_idx",
+            "snapshot_id",
+            "position",
+            postgresql_include=[
+                "team_id", "nota_final", "ci_lower", "ci_upper", "incerteza", "games_count",
+                "score_colley", "score_massey", "score_elo_final", "score_elo_mov",
+                "score_trueskill", "score_pagerank", "score_bradley_terry", "score_pca",
+                "score_sos", "score_consistency", "score_integrado",
+            ],
+        ),
+    )
     
     id = Column(Integer, primary_key=True)
     snapshot_id = Column(Integer, ForeignKey("ranking_snapshots.id"), nullable=False)
     team_id = Column(Integer, ForeignKey("teams.id"), nullable=False)
     position = Column(Integer, nullable=False)
-    nota_final = Column(Numeric, nullable=False)
-    ci_lower = Column(Numeric, nullable=False)
-    ci_upper = Column(Numeric, nullable=False)
-    incerteza = Column(Numeric, nullable=False)
+    nota_final = Column(Numeric(asdecimal=False), nullable=False)
+    ci_lower = Column(Numeric(asdecimal=False), nullable=False)
+    ci_upper = Column(Numeric(asdecimal=False), nullable=False)
+    incerteza = Column(Numeric(asdecimal=False), nullable=False)
     games_count = Column(Integer, nullable=False)
     
     # Scores individuais
-    score_colley = Column(Numeric)
-    score_massey = Column(Numeric)
-    score_elo_final = Column(Numeric)
-    score_elo_mov = Column(Numeric)
-    score_trueskill = Column(Numeric)
-    score_pagerank = Column(Numeric)
-    score_bradley_terry = Column(Numeric)
-    score_pca = Column(Numeric)
-    score_sos = Column(Numeric)
-    score_consistency = Column(Numeric)
-    score_integrado = Column(Numeric)
+    score_colley = Column(Numeric(asdecimal=False))
+    score_massey = Column(Numeric(asdecimal=False))
+    score_elo_final = Column(Numeric(asdecimal=False))
+    score_elo_mov = Column(Numeric(asdecimal=False))
+    score_trueskill = Column(Numeric(asdecimal=False))
+    score_pagerank = Column(Numeric(asdecimal=False))
+    score_bradley_terry = Column(Numeric(asdecimal=False))
+    score_pca = Column(Numeric(asdecimal=False))
+    score_sos = Column(Numeric(asdecimal=False))
+    score_consistency = Column(Numeric(asdecimal=False))
+    score_integrado = Column(Numeric(asdecimal=False))
     
     created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
     
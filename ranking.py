@@ -7,14 +7,15 @@ import logging
 import os
 import numpy as np
 import pandas as pd
-import networkx as nx
 import trueskill
+from scipy import linalg, sparse
 from scipy.optimize import minimize
+from scipy.special import gammaln
 from sklearn.decomposition import PCA
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 
-from sqlalchemy.orm import selectinload
+from sqlalchemy.orm import selectinload, lazyload, load_only
 from models import Team, Match, TeamMatchInfo
 from models import RankingSnapshot, RankingHistory
 
@@ -36,6 +37,29 @@ PRIOR_VARIANCE = 185**2
 
 MIN_GAMES_FOR_RANKING = int(os.getenv("MIN_GAMES_FOR_RANKING", "10"))
 
+# Pesos do rating integrado
+INTEGRATED_WEIGHTS = dict(
+    base        = 0.55,
+    sos         = 0.17,
+    consistency = 0.05,
+    pca         = 0.23
+)
+
+# Nome do score na API -> coluna do DataFrame final do ranking
+SCORE_COLUMNS = {
+    "colley": "r_colley",
+    "massey": "r_massey",
+    "elo": "r_elo_final",
+    "elo_mov": "r_elo_mov",
+    "trueskill": "ts_score",
+    "pagerank": "r_pagerank",
+    "bradley_terry": "r_bt_pois",
+    "pca": "pca_score",
+    "sos": "sos_score",
+    "consistency": "consistency",
+    "integrado": "rating_integrado",
+}
+
 class BayesianRating:
     """Classe para rating Bayesiano"""
     def __init__(self, m=PRIOR_MEAN, v=PRIOR_VARIANCE):
@@ -67,6 +91,25 @@ class RankingCalculator:
         self.team_to_idx = {t: i for i, t in enumerate(self.all_teams)}
         self.idx_to_team = {i: t for t, i in self.team_to_idx.items()}
         
+        # Índices dos times de cada partida (matches_df já vem em ordem
+        # cronológica), calculados uma vez e usados por todos os métodos
+        self.i_idx = self.matches_df["team_i"].map(self.team_to_idx).to_numpy()
+        self.j_idx = self.matches_df["team_j"].map(self.team_to_idx).to_numpy()
+        
+        # Colunas de cada partida em arrays contíguos, extraídas do DataFrame
+        # uma vez e lidas diretamente pelos métodos de rating
+        df = self.matches_df
+        self.score_i = df["score_i"].to_numpy(dtype=float)
+        self.score_j = df["score_j"].to_numpy(dtype=float)
+        self.res_i = df["res_i"].to_numpy().astype(bool)
+        self.time_weight = df["time_weight"].to_numpy(dtype=float)
+        self.margin_adj = self.margin_adjustments()
+        self.winner = np.where(self.res_i, self.i_idx, self.j_idx)
+        self.loser = np.where(self.res_i, self.j_idx, self.i_idx)
+        
+        # Colley é usado no ranking e como semente do Elo: calculado uma vez
+        self._colley = None
+        
         logger.info(f"✔️ Total de equipes: {self.n}")
         logger.info(f"✔️ Total de partidas: {len(self.matches_df)}")
         
@@ -105,6 +148,7 @@ class RankingCalculator:
             seen_matches.add(match_key)
             
             data.append({
+                "id": match.idPartida,
                 "team_i": team_i_name,
                 "team_j": team_j_name,
                 "score_i": int(match.score_i),
@@ -129,7 +173,9 @@ class RankingCalculator:
         days_old = (latest_dt - df["datetime"]).dt.total_seconds() / 86_400
         df["time_weight"] = 0.5 ** (days_old / TIME_DECAY_DAYS)
         
-        return df.sort_values("datetime").reset_index(drop=True)
+        # Ordem cronológica determinística: partidas no mesmo horário são
+        # desempatadas pelo id (Elo, TrueSkill e consistência dependem da ordem)
+        return df.sort_values(["datetime", "id"], kind="stable").reset_index(drop=True)
     
     def advanced_margin_adjustment(self, margin, total_score):
         """Ajuste avançado de margem"""
@@ -141,94 +187,106 @@ class RankingCalculator:
         score_factor = 1 + 0.1 * np.log1p(total_score)
         return adjusted * score_factor
     
-    def calculate_sos(self, rating_dict):
-        """Strength of Schedule"""
-        sos = {}
-        for t in self.all_teams:
-            rows = self.matches_df[(self.matches_df["team_i"] == t) | (self.matches_df["team_j"] == t)]
-            opp = np.where(rows["team_i"] == t, rows["team_j"], rows["team_i"])
-            vals = [rating_dict[o] for o in opp]
-            weights = rows["time_weight"].values
-            sos[t] = np.average(vals, weights=weights) if len(vals) else 0
-        m, s = np.mean(list(sos.values())), np.std(list(sos.values())) or 1
-        return {k: (v-m)/s for k,v in sos.items()}
+    def games_per_team(self):
+        """Número de partidas de cada time (na ordem de all_teams)"""
+        return np.bincount(self.i_idx, minlength=self.n) + np.bincount(self.j_idx, minlength=self.n)
     
-    def consistency_score(self, team):
-        """Score de consistência"""
-        tm = self.matches_df[(self.matches_df["team_i"] == team) | (self.matches_df["team_j"] == team)].sort_values("datetime")
-        if len(tm) < 5: return 1.0
-        w_size = min(5, len(tm)//2)
-        perf = []
-        for i in range(len(tm)-w_size+1):
-            win, diff = 0, 0
-            for _, m in tm.iloc[i:i+w_size].iterrows():
-                if m["team_i"] == team:
-                    win += m["res_i"]; diff += m["score_i"] - m["score_j"]
-                else:
-                    win += m["res_j"]; diff += m["score_j"] - m["score_i"]
-            perf.append(win/w_size + 0.01*diff)
-        return 1/(1+np.std(perf)) if len(perf)>1 else 1.0
+    def margin_adjustments(self):
+        """Ajuste avançado de margem para todas as partidas (vetorizado)"""
+        margin = self.matches_df["margin"].to_numpy(dtype=float)
+        total_score = self.matches_df["total_score"].to_numpy(dtype=float)
+        relative_margin = np.divide(margin, total_score, out=np.zeros_like(margin), where=total_score > 0)
+        adjusted = 2 * np.arctan(relative_margin * 2) / np.pi
+        score_factor = 1 + 0.1 * np.log1p(total_score)
+        return adjusted * score_factor
+    
+    def calculate_sos(self, ratings):
+        """Strength of Schedule (média dos ratings dos adversários ponderada pelo tempo)"""
+        n = self.n
+        w = self.time_weight
+        opp_sum = (np.bincount(self.i_idx, weights=w*ratings[self.j_idx], minlength=n) +
+                   np.bincount(self.j_idx, weights=w*ratings[self.i_idx], minlength=n))
+        w_sum = np.bincount(self.i_idx, weights=w, minlength=n) + np.bincount(self.j_idx, weights=w, minlength=n)
+        sos = np.divide(opp_sum, w_sum, out=np.zeros(n), where=w_sum > 0)
+        m, s = sos.mean(), sos.std() or 1
+        return (sos-m)/s
+    
+    def calculate_consistency(self):
+        """Score de consistência de todos os times (janelas móveis sobre as partidas de cada time)"""
+        diff_i = self.score_i - self.score_j
+        
+        # Cada partida vista pelos dois lados, agrupada por time em ordem cronológica
+        team = np.concatenate([self.i_idx, self.j_idx])
+        order = np.tile(np.arange(len(diff_i)), 2)
+        win = np.concatenate([self.res_i, ~self.res_i]).astype(int)
+        diff = np.concatenate([diff_i, -diff_i])
+        
+        sort = np.lexsort((order, team))
+        team, win, diff = team[sort], win[sort], diff[sort]
+        bounds = np.searchsorted(team, np.arange(self.n + 1))
+        
+        consistency = np.ones(self.n)
+        for t in range(self.n):
+            start, end = bounds[t], bounds[t+1]
+            if end - start < 5:
+                continue
+            w_size = min(5, (end - start)//2)
+            cum_win = np.r_[0, np.cumsum(win[start:end])]
+            cum_diff = np.r_[0, np.cumsum(diff[start:end])]
+            perf = (cum_win[w_size:] - cum_win[:-w_size])/w_size + 0.01*(cum_diff[w_size:] - cum_diff[:-w_size])
+            consistency[t] = 1/(1+np.std(perf))
+        
+        return consistency
     
     def calculate_colley(self):
         """Calcula rating Colley"""
+        if self._colley is not None:
+            return self._colley
+        
         print("🏗️ Calculando Colley…")
         n = self.n
-        G = np.zeros(n); W = np.zeros(n); L = np.zeros(n)
+        i_idx, j_idx = self.i_idx, self.j_idx
+        w = self.time_weight
+        
+        G = np.bincount(i_idx, weights=w, minlength=n) + np.bincount(j_idx, weights=w, minlength=n)
+        W = np.bincount(self.winner, weights=w, minlength=n)
+        L = np.bincount(self.loser, weights=w, minlength=n)
         N_mat = np.zeros((n, n))
+        np.add.at(N_mat, (i_idx, j_idx), w)
+        np.add.at(N_mat, (j_idx, i_idx), w)
         
-        for _, r in self.matches_df.iterrows():
-            i = self.team_to_idx.get(r.team_i)
-            j = self.team_to_idx.get(r.team_j)
-            if i is None or j is None:
-                continue
-            
-            w = r.time_weight
-            G[i] += w; G[j] += w
-            if r.res_i: 
-                W[i] += w; L[j] += w
-            else:       
-                W[j] += w; L[i] += w
-            N_mat[i, j] += w; N_mat[j, i] += w
-        
-        C = np.zeros((n, n))
-        for i in range(n):
-            C[i, i] = 2 + G[i]
-            C[i] -= N_mat[i]
-        C[np.diag_indices_from(C)] += N_mat.sum(axis=1)
+        C = -N_mat
+        C[np.diag_indices_from(C)] += 2 + G + N_mat.sum(axis=1)
         
         b = 1 + (W - L) / 2
         r_colley = np.linalg.solve(C, b)
         
+        self._colley = r_colley
         return r_colley
     
     def calculate_massey(self):
         """Calcula rating Massey"""
         print("🏗️ Calculando Massey…")
         n = self.n
-        G = np.zeros(n)
-        N_mat = np.zeros((n, n))
-        y = np.zeros(n)
-        
-        for _, r in self.matches_df.iterrows():
-            i = self.team_to_idx.get(r.team_i)
-            j = self.team_to_idx.get(r.team_j)
-            if i is None or j is None:
-                continue
-            
-            w = r.time_weight
-            G[i] += w; G[j] += w
-            diff = self.advanced_margin_adjustment(r.margin, r.total_score)
-            diff = diff if r.res_i else -diff
-            y[i] += diff * w; y[j] -= diff * w
-            N_mat[i, j] += w; N_mat[j, i] += w
+        i_idx, j_idx = self.i_idx, self.j_idx
+        w = self.time_weight
+        diff = np.where(self.res_i, self.margin_adj, -self.margin_adj) * w
         
         M = np.zeros((n, n))
-        for i in range(n):
-            M[i, i] = G[i]
-            M[i] -= N_mat[i]
+        np.add.at(M, (i_idx, i_idx), w)
+        np.add.at(M, (j_idx, j_idx), w)
+        np.add.at(M, (i_idx, j_idx), -w)
+        np.add.at(M, (j_idx, i_idx), -w)
+        y = np.bincount(i_idx, weights=diff, minlength=n) - np.bincount(j_idx, weights=diff, minlength=n)
+        
         M_prime, y_prime = M.copy(), y.copy()
         M_prime[-1] = 1; y_prime[-1] = 0
-        r_massey, *_ = np.linalg.lstsq(M_prime, y_prime, rcond=None)
+        # QR com pivotamento (gelsy): bem mais barato que o SVD do gelsd. O corte
+        # de posto é o mesmo do np.linalg.lstsq (eps * n), para manter a solução
+        # de norma mínima quando há grupos de times desconectados
+        r_massey, *_ = linalg.lstsq(
+            M_prime, y_prime, cond=np.finfo(float).eps*n, lapack_driver="gelsy"
+        )
         
         return r_massey
     
@@ -245,33 +303,41 @@ class RankingCalculator:
             diff = abs(Ri - Rj)
             return K0 * diff/(C+diff) if diff else K0
         
-        def run_elo(use_mov=False):
-            ratings = elo_seed.copy()
-            games = np.zeros(self.n)
-            
-            for _, r in self.matches_df.sort_values("datetime").iterrows():
-                i = self.team_to_idx.get(r.team_i)
-                j = self.team_to_idx.get(r.team_j)
-                if i is None or j is None:
-                    continue
-                
-                games[i] += 1; games[j] += 1
-                Ri, Rj = ratings[i], ratings[j]
-                Ei = 1/(1+10**((Rj-Ri)/400)); Ej = 1-Ei
-                mult = self.advanced_margin_adjustment(r.margin, r.total_score) if use_mov else 1.0
-                mult *= r.time_weight
-                ratings[i] += dynamic_K(Ri,Rj)*mult*(r.res_i - Ei)
-                ratings[j] += dynamic_K(Rj,Ri)*mult*(r.res_j - Ej)
-            
-            # Bayesian adjustment
-            bayes = BayesianRating()
-            for i in range(self.n):
-                ratings[i], _ = bayes.update(ratings[i], games[i])
+        # Dados das partidas (ordem cronológica) carregados uma vez em listas,
+        # para o laço sequencial do Elo não passar por iterrows
+        i_idx = self.i_idx.tolist()
+        j_idx = self.j_idx.tolist()
+        res_i = self.res_i.astype(int).tolist()
+        res_j = (~self.res_i).astype(int).tolist()
+        time_weight = self.time_weight.tolist()
+        mov_mult = (self.margin_adj * self.time_weight).tolist()
+        
+        # As duas variantes (peso temporal e margem de vitória) andam juntas
+        # em uma única passada; K é simétrico, então é calculado uma vez por lado
+        ratings = elo_seed.tolist()
+        ratings_mov = elo_seed.tolist()
+        for i, j, ri, rj, w, mult in zip(i_idx, j_idx, res_i, res_j, time_weight, mov_mult):
+            Ri, Rj = ratings[i], ratings[j]
+            Ei = 1/(1+10**((Rj-Ri)/400)); Ej = 1-Ei
+            K = dynamic_K(Ri, Rj)*w
+            ratings[i] += K*(ri - Ei)
+            ratings[j] += K*(rj - Ej)
             
-            return ratings, games
+            Ri, Rj = ratings_mov[i], ratings_mov[j]
+            Ei = 1/(1+10**((Rj-Ri)/400)); Ej = 1-Ei
+            K = dynamic_K(Ri, Rj)*mult
+            ratings_mov[i] += K*(ri - Ei)
+            ratings_mov[j] += K*(rj - Ej)
+        
+        games_count = self.games_per_team().astype(float)
         
-        r_elo_final, games_count = run_elo(False)
-        r_elo_mov, _ = run_elo(True)
+        # Bayesian adjustment
+        bayes = BayesianRating()
+        for i, games in enumerate(games_count.tolist()):
+            ratings[i], _ = bayes.update(ratings[i], games)
+            ratings_mov[i], _ = bayes.update(ratings_mov[i], games)
+        
+        r_elo_final, r_elo_mov = np.array(ratings), np.array(ratings_mov)
         
         return r_elo_final, r_elo_mov, games_count
     
@@ -279,68 +345,67 @@ class RankingCalculator:
         """Calcula ratings TrueSkill"""
         print("🏗️ Calculando TrueSkill…")
         ts_env = trueskill.TrueSkill(draw_probability=0)
-        ts_ratings = {t: ts_env.create_rating() for t in self.all_teams}
+        ts_ratings = [ts_env.create_rating() for _ in range(self.n)]
         
-        for _, r in self.matches_df.sort_values("datetime").iterrows():
-            ti, tj = r.team_i, r.team_j
-            Ri, Rj = ts_ratings[ti], ts_ratings[tj]
+        for i, j, res_i, w in zip(self.i_idx.tolist(), self.j_idx.tolist(),
+                                  self.res_i.tolist(), self.time_weight.tolist()):
+            Ri, Rj = ts_ratings[i], ts_ratings[j]
             new_Ri, new_Rj = (ts_env.rate_1vs1(Ri, Rj)
-                              if r.res_i else ts_env.rate_1vs1(Rj, Ri)[::-1])
-            w = r.time_weight
-            ts_ratings[ti] = trueskill.Rating(Ri.mu*(1-w)+new_Ri.mu*w,
-                                              Ri.sigma*(1-w)+new_Ri.sigma*w)
-            ts_ratings[tj] = trueskill.Rating(Rj.mu*(1-w)+new_Rj.mu*w,
-                                              Rj.sigma*(1-w)+new_Rj.sigma*w)
-        
-        ts_score = np.array([
-            ts_ratings[self.idx_to_team[i]].mu - 3*ts_ratings[self.idx_to_team[i]].sigma
-            for i in range(self.n)
-        ])
+                              if res_i else ts_env.rate_1vs1(Rj, Ri)[::-1])
+            ts_ratings[i] = trueskill.Rating(Ri.mu*(1-w)+new_Ri.mu*w,
+                                             Ri.sigma*(1-w)+new_Ri.sigma*w)
+            ts_ratings[j] = trueskill.Rating(Rj.mu*(1-w)+new_Rj.mu*w,
+                                             Rj.sigma*(1-w)+new_Rj.sigma*w)
+        
+        ts_score = np.array([r.mu - 3*r.sigma for r in ts_ratings])
         
         return ts_score
     
-    def calculate_pagerank(self):
-        """Calcula PageRank"""
+    def calculate_pagerank(self, max_iter=100, tol=1.0e-6):
+        """Calcula PageRank (power iteration sobre a matriz esparsa perdedor -> vencedor)"""
         print("🏗️ Calculando PageRank…")
-        G_pr = nx.DiGraph()
-        G_pr.add_nodes_from(self.all_teams)
-        
-        for _, r in self.matches_df.iterrows():
-            winner = r.team_i if r.res_i else r.team_j
-            loser = r.team_j if r.res_i else r.team_i
-            weight = (1 + ALPHA_PAGERANK*self.advanced_margin_adjustment(r.margin, r.total_score)) * r.time_weight
-            
-            if G_pr.has_edge(loser, winner):
-                G_pr[loser][winner]["weight"] += weight
-            else:
-                G_pr.add_edge(loser, winner, weight=weight)
-        
-        pr_dict = nx.pagerank(G_pr, alpha=DAMPING_PAGERANK, weight="weight")
-        r_pagerank = np.array([pr_dict[t] for t in self.all_teams])
-        
-        return r_pagerank
+        n = self.n
+        weight = (1 + ALPHA_PAGERANK*self.margin_adj) * self.time_weight
+        
+        # Arestas repetidas (mesmo perdedor -> vencedor) são somadas na montagem
+        A = sparse.csr_array((weight, (self.loser, self.winner)), shape=(n, n))
+        
+        # Normaliza as linhas; times sem derrotas redistribuem o peso uniformemente
+        out_weight = A.sum(axis=1)
+        inv = np.divide(1.0, out_weight, out=np.zeros(n), where=out_weight != 0)
+        A = sparse.diags_array(inv) @ A
+        dangling = out_weight == 0
+        
+        p = np.full(n, 1.0 / n)
+        x = p
+        for _ in range(max_iter):
+            x_last = x
+            x = DAMPING_PAGERANK*(x @ A + x[dangling].sum()*p) + (1 - DAMPING_PAGERANK)*p
+            if np.abs(x - x_last).sum() < n*tol:
+                return x
+        
+        raise RuntimeError(f"PageRank não convergiu em {max_iter} iterações")
     
     def calculate_bradley_terry_poisson(self):
         """Calcula Bradley-Terry-Poisson"""
         print("🏗️ Calculando Bradley-Terry-Poisson…")
-        pairwise = []
-        for _, r in self.matches_df.iterrows():
-            i = self.team_to_idx.get(r.team_i)
-            j = self.team_to_idx.get(r.team_j)
-            if i is not None and j is not None:
-                pairwise.append((i, j, r.score_i, r.score_j, r.time_weight))
+        i_idx, j_idx = self.i_idx, self.j_idx
+        si, sj, w = self.score_i, self.score_j, self.time_weight
+        # Termo constante da log-verossimilhança, fixo entre as iterações
+        const = np.sum(w*(gammaln(si+1) + gammaln(sj+1)))
         
         def nll_poisson(beta_free):
             beta = np.r_[0.0, beta_free]
-            ll = 0.0
-            for i,j,si,sj,w in pairwise:
-                diff = beta[i] - beta[j]
-                lam_i, lam_j = math.exp(diff), math.exp(-diff)
-                ll += w*(si*math.log(lam_i) - lam_i - math.lgamma(si+1))
-                ll += w*(sj*math.log(lam_j) - lam_j - math.lgamma(sj+1))
-            return -ll
-        
-        opt = minimize(nll_poisson, np.zeros(self.n-1), method="BFGS")
+            diff = beta[i_idx] - beta[j_idx]
+            lam_i, lam_j = np.exp(diff), np.exp(-diff)
+            ll = np.sum(w*(si*diff - lam_i + sj*(-diff) - lam_j)) - const
+            
+            # Gradiente analítico: d ll / d diff acumulado por time
+            g = w*(si - lam_i - sj + lam_j)
+            grad = np.bincount(i_idx, weights=g, minlength=self.n) - np.bincount(j_idx, weights=g, minlength=self.n)
+            return -ll, -grad[1:]
+        
+        opt = minimize(nll_poisson, np.zeros(self.n-1), method="BFGS", jac=True)
         r_bt_poisson = np.r_[0.0, opt.x]
         
         return r_bt_poisson
@@ -371,9 +436,8 @@ class RankingCalculator:
         
         # Métricas avançadas
         print("🔧 Integrando métricas avançadas…")
-        sos = self.calculate_sos(dict(zip(combined.team, combined.r_elo_final)))
-        combined["sos_score"] = combined.team.map(sos)
-        combined["consistency"] = combined.team.apply(self.consistency_score)
+        combined["sos_score"] = self.calculate_sos(r_elo_final)
+        combined["consistency"] = self.calculate_consistency()
         
         # Normalização e posições
         methods = ["r_colley","r_massey","r_elo_final","r_elo_mov","ts_score","r_pagerank","r_bt_pois"]
@@ -387,23 +451,17 @@ class RankingCalculator:
         for m in methods:
             combined["borda_score"] += (self.n - combined[f"pos_{m}"] + 1)
                 
-        # PCA
+        # PCA (matriz de z-scores extraída uma vez e reusada na média da base)
         print("🔬 Calculando PCA…")
-        z = combined[[f"{m}_z" for m in methods]].values
+        z = combined[[f"{m}_z" for m in methods]].to_numpy()
         pca = PCA(n_components=3)
         combined["pca_score"] = pca.fit_transform(z)[:,0]
         
         # Rating final
         print("🎯 Calculando rating final…")
-        w = dict(
-            base        = 0.55,
-            sos         = 0.17,
-            consistency = 0.05,
-            pca         = 0.23
-        )
-        
+        w = INTEGRATED_WEIGHTS
         combined["rating_integrado"] = (
-            w["base"]*combined[[f"{m}_z" for m in methods]].mean(1) +
+            w["base"]*z.mean(axis=1) +
             w["sos"]*combined.sos_score +
             w["consistency"]*combined.consistency +
             w["pca"]*combined.pca_score
@@ -414,17 +472,16 @@ class RankingCalculator:
         
         # Nota final 0-100
         base = combined.rating_ajustado
-        combined["NOTA_FINAL"] = (100*(base-base.min())/(base.max()-base.min())).round(2)
-        
-        # Intervalos de confiança
-        def confidence(row):
-            std = 12/math.sqrt(1+row.games_count/5) * (1.5-0.5*row.consistency)
-            return pd.Series({
-                "ci_lower": round(max(0,row.NOTA_FINAL-1.96*std),2),
-                "ci_upper": round(min(100,row.NOTA_FINAL+1.96*std),2),
-                "incerteza": round(std,2)
-            })
-        combined = pd.concat([combined, combined.apply(confidence, axis=1)], axis=1)
+        lo, hi = base.min(), base.max()
+        combined["NOTA_FINAL"] = (100*(base-lo)/(hi-lo)).round(2)
+        
+        # Intervalos de confiança (vetorizado sobre todos os times)
+        games = combined.games_count.to_numpy(dtype=float)
+        nota = combined.NOTA_FINAL.to_numpy(dtype=float)
+        std = 12/np.sqrt(1+games/5) * (1.5-0.5*combined.consistency.to_numpy(dtype=float))
+        combined["ci_lower"] = np.round(np.maximum(0, nota-1.96*std), 2)
+        combined["ci_upper"] = np.round(np.minimum(100, nota+1.96*std), 2)
+        combined["incerteza"] = np.round(std, 2)
         
         # Mapeia informações dos times
         team_info = {}
@@ -460,70 +517,62 @@ async def calculate_ranking(
       - baseline="latest":     último snapshot (uso típico do /ranking/preview)
     """
     try:
-        # 1) Times
-        teams_result = await db.execute(select(Team))
+        # 1) Times (só as colunas usadas no cálculo e na saída)
+        teams_result = await db.execute(
+            select(Team).options(load_only(Team.id, Team.name, Team.tag, Team.org))
+        )
         teams = teams_result.scalars().all()
         logger.info(f"🔄 Total de times: {len(teams)}")
         
-        # 2) Partidas (com joins necessários)
+        # 2) Partidas (só colunas e relacionamentos usados no cálculo; torneio e
+        #    team_match_info, carregados por padrão via joined, ficam de fora)
         matches_stmt = (
             select(Match)
             .options(
-                selectinload(Match.tournament_rel),
-                selectinload(Match.team_i_obj),
-                selectinload(Match.team_j_obj),
+                load_only(
+                    Match.date, Match.time, Match.team_i, Match.team_j,
+                    Match.score_i, Match.score_j, Match.mapa,
+                ),
+                lazyload(Match.tmi_a_rel),
+                lazyload(Match.tmi_b_rel),
+                selectinload(Match.team_i_obj).load_only(Team.id, Team.name, Team.tag, Team.org),
+                selectinload(Match.team_j_obj).load_only(Team.id, Team.name, Team.tag, Team.org),
             )
-            .order_by(Match.date)
+            .order_by(Match.date, Match.time, Match.idPartida)
         )
         matches_result = await db.execute(matches_stmt)
         all_matches = list(matches_result.scalars())
         logger.info(f"📊 Total de partidas: {len(all_matches)}")
         
-        # 3) Remover duplicatas (chave: {teams ordenados} + datetime + mapa)
-        match_keys: set[tuple[str, ...]] = set()
-        unique_matches: list[Match] = []
-        for match in all_matches:
-            if not match.team_i_obj or not match.team_j_obj:
-                continue
-
-            match_datetime = (
-                datetime.combine(match.date, match.time)
-                if match.date and match.time
-                else datetime.now()
-            )
-
-            key = tuple(sorted([
-                match.team_i_obj.name.strip(),
-                match.team_j_obj.name.strip(),
-            ]) + [
-                match_datetime.strftime("%Y-%m-%d %H:%M"),
-                match.mapa or "",
-            ])
-
-            if key not in match_keys:
-                match_keys.add(key)
-                unique_matches.append(match)
-
-        logger.info(f"✔️ Partidas únicas: {len(unique_matches)}")
-        if len(unique_matches) == 0:
+        # 3) Cálculo do ranking (com TODOS os times/partidas). Partidas
+        #    inválidas e duplicatas (chave: {teams ordenados} + datetime + mapa)
+        #    são descartadas uma única vez pelo RankingCalculator
+        try:
+            calculator = RankingCalculator(teams, all_matches)
+        except ValueError:
             logger.warning("Nenhuma partida válida encontrada")
             return []
+        logger.info(f"✔️ Partidas únicas: {len(calculator.matches_df)}")
+        
+        # Se nenhum time atinge o mínimo de jogos, o filtro abaixo esvaziaria o
+        # ranking de qualquer forma: evita calcular todas as métricas à toa
+        if calculator.games_per_team().max() < MIN_GAMES_FOR_RANKING:
+            logger.info(f"ℹ️ Nenhum time com >= {MIN_GAMES_FOR_RANKING} jogos; ranking vazio")
+            return []
         
-        # 4) Cálculo do ranking (com TODOS os times/partidas)
-        calculator = RankingCalculator(teams, unique_matches)
         ranking_df = calculator.calculate_final_ranking()
 
-        # 5) Filtro de elegibilidade: >= MIN_GAMES_FOR_RANKING
+        # 4) Filtro de elegibilidade: >= MIN_GAMES_FOR_RANKING
         before = len(ranking_df)
         ranking_df = ranking_df[ranking_df["games_count"] >= MIN_GAMES_FOR_RANKING].copy()
         logger.info(
             f"↪️ Filtro min games: removidos {before - len(ranking_df)} times com < {MIN_GAMES_FOR_RANKING} jogos"
         )
 
-        # 6) Ordenação final por nota (NOTA_FINAL já normalizada com TODOS os times)
+        # 5) Ordenação final por nota (NOTA_FINAL já normalizada com TODOS os times)
         ranking_df = ranking_df.sort_values("NOTA_FINAL", ascending=False).reset_index(drop=True)
 
-        # 7) Snapshot de referência p/ variação
+        # 6) Snapshot de referência p/ variação
         previous_data: dict[int, dict[str, float | int]] = {}
         if include_variation:
             try:
@@ -561,56 +610,58 @@ async def calculate_ranking(
             except Exception as e:
                 logger.warning(f"⚠️ Erro ao buscar snapshot de referência: {e}")
 
-        # 8) Serialização para a API
+        # 7) Serialização para a API
+        # Colunas extraídas uma vez como listas Python (scores em uma matriz
+        # times x algoritmos), em vez de montar uma Series por linha com iterrows
+        team_ids = [int(t) if pd.notna(t) else None for t in ranking_df["team_id"]]
+        team_names = ranking_df["team"].tolist()
+        tags = ranking_df["tag"].tolist()
+        universities = ranking_df["university"].tolist()
+        notas = ranking_df["NOTA_FINAL"].to_numpy(dtype=float).tolist()
+        ci_lower = ranking_df["ci_lower"].to_numpy(dtype=float).tolist()
+        ci_upper = ranking_df["ci_upper"].to_numpy(dtype=float).tolist()
+        incerteza = ranking_df["incerteza"].to_numpy(dtype=float).tolist()
+        games_count = ranking_df["games_count"].to_numpy(dtype=int).tolist()
+        borda = ranking_df["borda_score"].to_numpy(dtype=int).tolist()
+        scores_matrix = ranking_df[list(SCORE_COLUMNS.values())].to_numpy(dtype=float).tolist()
+
         result: List[dict[str, Any]] = []
-        for idx, row in ranking_df.iterrows():
-            position = int(idx) + 1
+        for i, team_id in enumerate(team_ids):
+            position = i + 1
 
             variacao: Optional[int] = None
             variacao_nota: Optional[float] = None
             is_new = False
 
-            if include_variation and pd.notna(row.team_id):
-                team_id_int = int(row.team_id)
-                prev = previous_data.get(team_id_int)
+            if include_variation and team_id is not None:
+                prev = previous_data.get(team_id)
                 if prev:
                     posicao_anterior = int(prev["position"])
                     variacao = posicao_anterior - position
 
                     nota_anterior = float(prev["nota_final"])
-                    nota_atual = float(row.NOTA_FINAL)
-                    variacao_nota = round(nota_atual - nota_anterior, 2)
+                    variacao_nota = round(notas[i] - nota_anterior, 2)
                 else:
                     is_new = True
 
+            scores = dict(zip(SCORE_COLUMNS, scores_matrix[i]))
+            scores["borda"] = borda[i]
+
             result.append({
                 "posicao": position,
-                "team_id": int(row.team_id) if pd.notna(row.team_id) else None,
-                "team": row.team,
-                "tag": row.tag,
-                "university": row.university,
-                "nota_final": float(row.NOTA_FINAL),
-                "ci_lower": float(row.ci_lower),
-                "ci_upper": float(row.ci_upper),
-                "incerteza": float(row.incerteza),
-                "games_count": int(row.games_count),
+                "team_id": team_id,
+                "team": team_names[i],
+                "tag": tags[i],
+                "university": universities[i],
+                "nota_final": notas[i],
+                "ci_lower": ci_lower[i],
+                "ci_upper": ci_upper[i],
+                "incerteza": incerteza[i],
+                "games_count": games_count[i],
                 "variacao": variacao,
                 "variacao_nota": variacao_nota,
                 "is_new": is_new,
-                "scores": {
-                    "colley": float(row.r_colley),
-                    "massey": float(row.r_massey),
-                    "elo": float(row.r_elo_final),
-                    "elo_mov": float(row.r_elo_mov),
-                    "trueskill": float(row.ts_score),
-                    "pagerank": float(row.r_pagerank),
-                    "bradley_terry": float(row.r_bt_pois),
-                    "pca": float(row.pca_score),
-                    "sos": float(row.sos_score),
-                    "consistency": float(row.consistency),
-                    "borda": int(row.borda_score),
-                    "integrado": float(row.rating_integrado),
-                },
+                "scores": scores,
             })
 
         logger.info(f"🏆 Ranking calculado com sucesso para {len(result)} times (baseline={baseline})")
@@ -1,83 +1,189 @@
 # ranking_history.py
 import logging
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func
+from sqlalchemy import select, func, insert, text, literal
+from sqlalchemy.dialects.postgresql import aggregate_order_by
 from datetime import datetime, timezone
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple
 
-from models import RankingSnapshot, RankingHistory, Match
-from ranking import calculate_ranking
+from models import RankingSnapshot, RankingHistory, Match, Team
+from ranking import calculate_ranking, MIN_GAMES_FOR_RANKING
 
 logger = logging.getLogger(__name__)
 
-async def save_ranking_snapshot(db: AsyncSession) -> int:
+# Chave do advisory lock que serializa a criação de snapshots
+SNAPSHOT_LOCK_KEY = 918273645
+
+# Colunas de ranking_history, na ordem dos valores de cada tupla enviada via COPY
+HISTORY_COLUMNS = (
+    "snapshot_id", "team_id", "position",
+    "nota_final", "ci_lower", "ci_upper", "incerteza", "games_count",
+    "score_colley", "score_massey", "score_elo_final", "score_elo_mov",
+    "score_trueskill", "score_pagerank", "score_bradley_terry", "score_pca",
+    "score_sos", "score_consistency", "score_integrado",
+)
+
+# Impressão digital das colunas de matches lidas pelo ranking: como a tabela
+# não tem updated_at, correções em partidas já existentes (placar, data, mapa,
+# times) só aparecem comparando o conteúdo, não a contagem
+MATCHES_FINGERPRINT = func.md5(
+    func.string_agg(
+        func.concat_ws(
+            "|",
+            Match.idPartida, Match.score_i, Match.score_j, Match.date,
+            Match.time, Match.team_i, Match.team_j, func.coalesce(Match.mapa, ""),
+        ),
+        aggregate_order_by(literal(","), Match.idPartida),
+    )
+)
+
+# Idem para os times: o ranking usa slug, nome, tag e org (renomear ou fundir
+# times muda o cálculo e os dados publicados sem alterar nenhuma partida)
+TEAMS_FINGERPRINT = func.md5(
+    func.string_agg(
+        func.concat_ws(
+            "|",
+            Team.id, Team.slug, Team.name,
+            func.coalesce(Team.tag, ""), func.coalesce(Team.org, ""),
+        ),
+        aggregate_order_by(literal(","), Team.id),
+    )
+)
+
+def history_record(snapshot_id: int, ranking_item: Dict[str, Any]) -> tuple:
+    """Monta a linha de ranking_history de um time (mesma ordem de HISTORY_COLUMNS)"""
+    scores = ranking_item["scores"]
+    return (
+        snapshot_id,
+        ranking_item["team_id"],
+        ranking_item["posicao"],
+        ranking_item["nota_final"],
+        ranking_item["ci_lower"],
+        ranking_item["ci_upper"],
+        ranking_item["incerteza"],
+        ranking_item["games_count"],
+        scores["colley"],
+        scores["massey"],
+        scores["elo"],
+        scores["elo_mov"],
+        scores["trueskill"],
+        scores["pagerank"],
+        scores["bradley_terry"],
+        scores["pca"],
+        scores["sos"],
+        scores["consistency"],
+        scores["integrado"],
+    )
+
+async def save_ranking_snapshot(
+    db: AsyncSession, force: bool = False
+) -> Tuple[Optional[int], bool]:
     """
     Calcula o ranking atual e salva um snapshot no banco.
-    Retorna o ID do snapshot criado.
+    Retorna (snapshot_id, created): created=False quando nada foi gravado.
+
+    Se nenhuma entrada do cálculo mudou desde o último snapshot (mesma
+    contagem e data da partida mais recente, mesmas impressões digitais de
+    partidas e times e mesmo MIN_GAMES_FOR_RANKING), retorna o ID do snapshot
+    existente sem recalcular. Use force=True para criar um novo snapshot mesmo
+    assim (por exemplo, após mudar o código dos algoritmos).
     """
     try:
+        # Serializa snapshots concorrentes (lock liberado no commit/rollback).
+        # Quem esperar o lock encontra o snapshot recém-criado abaixo e retorna.
+        await db.execute(text("SELECT pg_advisory_xact_lock(:k)"), {"k": SNAPSHOT_LOCK_KEY})
+        
+        # Estado atual das entradas do cálculo (consulta barata, antes do cálculo)
+        match_state = await db.execute(
+            select(
+                func.count(Match.idPartida),
+                func.max(Match.created_at),
+                MATCHES_FINGERPRINT,
+                select(TEAMS_FINGERPRINT).scalar_subquery(),
+            )
+        )
+        match_count, last_match_at, matches_fingerprint, teams_fingerprint = match_state.one()
+        
+        # Entradas gravadas no metadata do snapshot e comparadas no próximo
+        inputs = {
+            "last_match_ts": last_match_at.isoformat() if last_match_at else None,
+            "matches_fingerprint": matches_fingerprint,
+            "teams_fingerprint": teams_fingerprint,
+            "min_games": MIN_GAMES_FOR_RANKING,
+        }
+        
+        if not force:
+            latest_result = await db.execute(
+                select(
+                    RankingSnapshot.id,
+                    RankingSnapshot.total_matches,
+                    RankingSnapshot.snapshot_metadata
+                )
+                .order_by(RankingSnapshot.created_at.desc())
+                .limit(1)
+            )
+            latest = latest_result.first()
+            
+            latest_metadata = (latest.snapshot_metadata or {}) if latest else {}
+            if (
+                latest
+                and latest.total_matches == match_count
+                and all(latest_metadata.get(key) == value for key, value in inputs.items())
+            ):
+                logger.info(f"⏭️ Nenhuma partida nova desde o snapshot #{latest.id}, mantendo o existente")
+                await db.rollback()  # libera o lock
+                return latest.id, False
+        
         # Calcula o ranking atual
         logger.info("🔄 Calculando ranking para snapshot...")
         ranking_data = await calculate_ranking(db, include_variation=False)
         
         if not ranking_data:
             logger.warning("Nenhum dado de ranking para salvar")
-            return None
-        
-        # Conta total de partidas
-        total_matches = await db.execute(select(func.count(Match.idPartida)))
-        match_count = total_matches.scalar() or 0
+            await db.rollback()  # libera o lock
+            return None, False
         
-        # Cria o snapshot
-        snapshot = RankingSnapshot(
-            total_matches=match_count,
-            total_teams=len(ranking_data),
-            snapshot_metadata={
-                "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
-                "version": "2.0",
-                "algorithms_used": [
-                    "colley", "massey", "elo", "trueskill", 
-                    "pagerank", "bradley_terry", "pca"
-                ]
-            }
+        # Cria o snapshot já obtendo o ID (INSERT ... RETURNING, sem flush do ORM)
+        snapshot_result = await db.execute(
+            insert(RankingSnapshot)
+            .values(
+                total_matches=match_count,
+                total_teams=len(ranking_data),
+                snapshot_metadata={
+                    "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                    **inputs,
+                    "version": "2.0",
+                    "algorithms_used": [
+                        "colley", "massey", "elo", "trueskill", 
+                        "pagerank", "bradley_terry", "pca"
+                    ]
+                }
+            )
+            .returning(RankingSnapshot.id)
         )
-        db.add(snapshot)
-        await db.flush()  # Para obter o ID
+        snapshot_id = snapshot_result.scalar_one()
         
-        # Salva o histórico de cada time
-        for ranking_item in ranking_data:
-            if ranking_item["team_id"] is None:
-                logger.warning(f"⚠️ Time '{ranking_item['team']}' sem team_id, pulando")
-                continue
-                
-            history_entry = RankingHistory(
-                snapshot_id=snapshot.id,
-                team_id=ranking_item["team_id"],
-                position=ranking_item["posicao"],
-                nota_final=ranking_item["nota_final"],
-                ci_lower=ranking_item["ci_lower"],
-                ci_upper=ranking_item["ci_upper"],
-                incerteza=ranking_item["incerteza"],
-                games_count=ranking_item["games_count"],
-                
-                # Scores individuais
-                score_colley=ranking_item["scores"]["colley"],
-                score_massey=ranking_item["scores"]["massey"],
-                score_elo_final=ranking_item["scores"]["elo"],
-                score_elo_mov=ranking_item["scores"]["elo_mov"],
-                score_trueskill=ranking_item["scores"]["trueskill"],
-                score_pagerank=ranking_item["scores"]["pagerank"],
-                score_bradley_terry=ranking_item["scores"]["bradley_terry"],
-                score_pca=ranking_item["scores"]["pca"],
-                score_sos=ranking_item["scores"]["sos"],
-                score_consistency=ranking_item["scores"]["consistency"],
-                score_integrado=ranking_item["scores"]["integrado"],
-            )
-            db.add(history_entry)
+        # Gera o histórico de cada time como tuplas, consumidas pelo COPY
+        # à medida que são enviadas (sem montar a lista inteira antes)
+        def iter_records():
+            for ranking_item in ranking_data:
+                if ranking_item["team_id"] is None:
+                    logger.warning(f"⚠️ Time '{ranking_item['team']}' sem team_id, pulando")
+                    continue
+                yield history_record(snapshot_id, ranking_item)
+        
+        # Envia as linhas via COPY do asyncpg, na mesma transação do snapshot
+        connection = await db.connection()
+        raw_connection = await connection.get_raw_connection()
+        await raw_connection.driver_connection.copy_records_to_table(
+            RankingHistory.__tablename__,
+            records=iter_records(),
+            columns=HISTORY_COLUMNS
+        )
         
         await db.commit()
-        logger.info(f"✅ Snapshot #{snapshot.id} salvo com {len(ranking_data)} times")
-        return snapshot.id
+        logger.info(f"✅ Snapshot #{snapshot_id} salvo com {len(ranking_data)} times")
+        return snapshot_id, True
         
     except Exception as e:
         logger.error(f"❌ Erro ao salvar snapshot: {str(e)}", exc_info=True)
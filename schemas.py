@@ -1,4 +1,4 @@
-from pydantic import BaseModel, ConfigDict, Field, field_serializer
+from pydantic import BaseModel, ConfigDict, TypeAdapter
 from datetime import datetime
 from typing import Optional, List, Dict, Any
 
@@ -11,7 +11,7 @@ class EstadoInfo(BaseModel):
     icone: str
     regiao: str
 
-    model_config = ConfigDict(from_attributes=True)
+    model_config = ConfigDict(from_attributes=True, frozen=True)
 
 # ===== TEAMS =====
 class Team(BaseModel):
@@ -57,28 +57,14 @@ class Tournament(BaseModel):
     model_config = ConfigDict(from_attributes=True)
 
 # ===== MATCHES =====
-class TeamInMatch(BaseModel):
-    """Team simplificado para uso em matches"""
-    id: int
-    name: str
-    logo: str
-    tag: str
-    slug: str
-    university: str
-    university_tag: str
-    estado: str
-    estado_info: Optional[EstadoInfo] = None
-    instagram: str
-    twitch: str
-
 class MatchTeamInfo(BaseModel):
     """
     Informações do time na partida
     IMPORTANTE: usa 'agent_1' até 'agent_5', não 'agent1'
     """
     id: str
-    team: TeamInMatch
-    score: int
+    team: Optional[Team] = None  # mesmo formato retornado pelos endpoints de times
+    score: Optional[int] = None
     agent_1: str
     agent_2: str
     agent_3: str
@@ -95,10 +81,14 @@ class Match(BaseModel):
     date: str  # ISO string
     tmi_a: MatchTeamInfo
     tmi_b: MatchTeamInfo
-    tournament: Tournament
+    tournament: Optional[Tournament] = None
 
     model_config = ConfigDict(from_attributes=True)
 
+# Valida e serializa listas de partidas de uma vez (pydantic-core), para os
+# endpoints que devolvem o JSON direto sem perder o contrato de List[Match]
+MATCH_LIST_ADAPTER = TypeAdapter(List[Match])
+
 # ===== RANKING =====
 class RankingScores(BaseModel):
     """Scores individuais dos algoritmos de ranking"""
@@ -114,6 +104,9 @@ class RankingScores(BaseModel):
     consistency: float
     integrado: float
 
+    # Imutáveis: montadas uma vez a partir do banco e nunca alteradas
+    model_config = ConfigDict(frozen=True)
+
 class RankingItem(BaseModel):
     """Item individual do ranking"""
     posicao: int
@@ -131,6 +124,8 @@ class RankingItem(BaseModel):
     is_new: bool = False
     scores: RankingScores
 
+    model_config = ConfigDict(frozen=True)
+
 class RankingResponse(BaseModel):
     """Resposta do endpoint /ranking"""
     cached: bool = False
@@ -139,6 +134,44 @@ class RankingResponse(BaseModel):
     total: int
     ranking: List[RankingItem]
 
+# Os itens do ranking vêm do nosso próprio cálculo/banco (dados confiáveis).
+# Com TRUSTED_INPUT os modelos são montados com model_construct, sem passar
+# pelos validadores; desligue para voltar a validar tudo com model_validate.
+TRUSTED_INPUT = True
+
+def build_ranking_item(row: Dict[str, Any], trusted: bool = TRUSTED_INPUT) -> RankingItem:
+    """Monta um RankingItem a partir de um dict no formato da API"""
+    if not trusted:
+        return RankingItem.model_validate(row)
+    
+    item = dict(row)
+    item["scores"] = RankingScores.model_construct(**row["scores"])
+    return RankingItem.model_construct(**item)
+
+def build_ranking_response(
+    rows: List[Any],
+    last_update: str,
+    limit: Optional[int] = None,
+    cached: bool = False,
+    trusted: bool = TRUSTED_INPUT
+) -> RankingResponse:
+    """Monta o RankingResponse a partir de dicts ou RankingItems já montados"""
+    items = [
+        row if isinstance(row, RankingItem) else build_ranking_item(row, trusted)
+        for row in rows
+    ]
+    
+    data = {
+        "cached": cached,
+        "last_update": last_update,
+        "limit": limit,
+        "total": len(items),
+        "ranking": items
+    }
+    if not trusted:
+        return RankingResponse.model_validate(data)
+    return RankingResponse.model_construct(**data)
+
 class RankingSnapshot(BaseModel):
     """Snapshot individual do ranking"""
     id: int
@@ -21,25 +21,17 @@ SUPABASE_SERVICE_ROLE = os.getenv("SUPABASE_SERVICE_ROLE")
 supabase: Client = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE)
 supabase.postgrest.auth(SUPABASE_SERVICE_ROLE)
 
+# Tamanho de página das consultas paginadas (max-rows padrão do PostgREST)
+PAGE_SIZE = 1000
+
 
 def analyze_tag_conflicts():
     """Analisa conflitos de tags entre times"""
     print("🔍 Analisando conflitos de tags...\n")
     
-    # Busca todos os times
-    teams = supabase.table("teams").select("id, slug, name, tag").execute().data
-    
-    # Agrupa por tag
-    teams_by_tag = {}
-    for team in teams:
-        if team.get("tag"):
-            tag = team["tag"]
-            if tag not in teams_by_tag:
-                teams_by_tag[tag] = []
-            teams_by_tag[tag].append(team)
-    
-    # Identifica tags com múltiplos times
-    conflicts = {tag: teams for tag, teams in teams_by_tag.items() if len(teams) > 1}
+    # Tags com múltiplos times, já agrupadas no banco (ver sql/tag_conflicts.sql)
+    rows = supabase.rpc("tag_conflicts").execute().data
+    conflicts = {row["tag"]: row["teams"] for row in rows}
     
     if conflicts:
         print("⚠️  Tags compartilhadas por múltiplos times:")
@@ -53,6 +45,21 @@ def analyze_tag_conflicts():
     return conflicts
 
 
+def iter_maua_presence(pipao_id: int, rbty_id: int, page_size: int = PAGE_SIZE):
+    """Percorre a presença dos times Mauá por snapshot, página a página"""
+    offset = 0
+    while True:
+        batch = (
+            supabase.rpc("maua_snapshot_presence", {"pipao": pipao_id, "rbty": rbty_id})
+            .range(offset, offset + page_size - 1)
+            .execute()
+        ).data
+        yield from batch
+        if len(batch) < page_size:
+            return
+        offset += page_size
+
+
 def check_maua_teams_in_snapshots():
     """Verifica especificamente os times Mauá nos snapshots"""
     print("\n\n🔍 Verificando times Mauá nos snapshots...")
@@ -60,7 +67,7 @@ def check_maua_teams_in_snapshots():
     # Busca os times Mauá
     maua_teams = (
         supabase.table("teams")
-        .select("id, slug, name, tag")
+        .select("id, slug")
         .in_("slug", ["maua_pipao", "maua_rbty"])
         .execute()
     ).data
@@ -77,52 +84,42 @@ def check_maua_teams_in_snapshots():
     print(f"\n   Mauá Esports A (maua_pipao): ID {pipao_id}")
     print(f"   Mauá Esports B (maua_rbty): ID {rbty_id}")
     
-    # Busca todos os snapshots
-    snapshots = (
-        supabase.table("ranking_snapshots")
-        .select("id, created_at, total_teams")
-        .order("created_at")
-        .execute()
-    ).data
-    
-    print(f"\n📊 Total de snapshots: {len(snapshots)}")
-    
-    # Para cada snapshot, verifica quais times Mauá estão presentes
+    # Presença dos times Mauá em cada snapshot, resolvida no banco (ver
+    # sql/maua_snapshot_presence.sql) e consumida em páginas, em ordem cronológica
     snapshots_with_issues = []
+    total_snapshots = 0
     
-    for snapshot in snapshots:
-        ranking = (
-            supabase.table("ranking_history")
-            .select("team_id, position, nota_final")
-            .eq("snapshot_id", snapshot["id"])
-            .in_("team_id", [pipao_id, rbty_id])
-            .execute()
-        ).data
+    # Para cada snapshot, verifica quais times Mauá estão presentes
+    for snapshot in iter_maua_presence(pipao_id, rbty_id):
+        total_snapshots += 1
+        has_pipao, has_rbty = snapshot["has_pipao"], snapshot["has_rbty"]
         
         # Analisa o resultado
-        teams_found = {entry["team_id"] for entry in ranking}
+        teams_found = {team_id for team_id, found in ((pipao_id, has_pipao), (rbty_id, has_rbty)) if found}
         
-        if pipao_id in teams_found and rbty_id in teams_found:
+        if has_pipao and has_rbty:
             status = "✅ Ambos times presentes"
-        elif pipao_id in teams_found:
+        elif has_pipao:
             status = "⚠️  Apenas maua_pipao"
-        elif rbty_id in teams_found:
+        elif has_rbty:
             status = "⚠️  Apenas maua_rbty"
         else:
             status = "❌ Nenhum time Mauá"
         
         if "⚠️" in status:
             snapshots_with_issues.append({
-                "snapshot_id": snapshot["id"],
+                "snapshot_id": snapshot["snapshot_id"],
                 "created_at": snapshot["created_at"],
                 "status": status,
                 "teams_found": teams_found
             })
         
         print(f"\n   Snapshot {snapshot['created_at'][:10]}: {status}")
-        for entry in ranking:
-            team_name = "maua_pipao" if entry["team_id"] == pipao_id else "maua_rbty"
-            print(f"      - {team_name}: posição {entry['position']}, nota {entry['nota_final']:.2f}")
+        for slug, prefix in (("maua_pipao", "pipao"), ("maua_rbty", "rbty")):
+            if snapshot[f"has_{prefix}"]:
+                print(f"      - {slug}: posição {snapshot[f'{prefix}_position']}, nota {snapshot[f'{prefix}_nota']:.2f}")
+    
+    print(f"\n📊 Total de snapshots: {total_snapshots}")
     
     return snapshots_with_issues
 
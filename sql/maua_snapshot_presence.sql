@@ -0,0 +1,35 @@
+-- Função RPC usada por snapshots_data/Untitled-1.py (check_maua_teams_in_snapshots)
+-- Aplicar manualmente no banco (Supabase SQL editor ou psql).
+
+-- Presença dos dois times Mauá em cada snapshot, resolvida no banco: uma
+-- linha por snapshot (em ordem cronológica) com a posição e a nota de cada
+-- time, ou NULL quando o time não aparece naquele snapshot.
+CREATE OR REPLACE FUNCTION maua_snapshot_presence(pipao integer, rbty integer)
+RETURNS TABLE (
+    snapshot_id integer,
+    created_at timestamptz,
+    has_pipao boolean,
+    has_rbty boolean,
+    pipao_position integer,
+    pipao_nota double precision,
+    rbty_position integer,
+    rbty_nota double precision
+)
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT
+        s.id,
+        s.created_at,
+        coalesce(bool_or(r.team_id = pipao), false),
+        coalesce(bool_or(r.team_id = rbty), false),
+        max(r.position) FILTER (WHERE r.team_id = pipao),
+        max(r.nota_final::float8) FILTER (WHERE r.team_id = pipao),
+        max(r.position) FILTER (WHERE r.team_id = rbty),
+        max(r.nota_final::float8) FILTER (WHERE r.team_id = rbty)
+    FROM ranking_snapshots s
+    LEFT JOIN ranking_history r
+        ON r.snapshot_id = s.id AND r.team_id IN (pipao, rbty)
+    GROUP BY s.id, s.created_at
+    ORDER BY s.created_at, s.id
+$$;
@@ -0,0 +1,16 @@
+-- Índices de ranking_history
+-- Aplicar manualmente no banco (Supabase SQL editor ou psql).
+-- CONCURRENTLY não pode rodar dentro de uma transação.
+
+-- Índice de cobertura para as leituras por snapshot ordenadas por posição
+-- (/ranking, /ranking/snapshots, detalhes de snapshot). Todas as colunas lidas
+-- estão no índice, então o Postgres faz index-only scan já na ordem de
+-- posição, sem visitar o heap e sem nó de ordenação.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ranking_history_snapshot_covering_idx
+    ON ranking_history (snapshot_id, position)
+    INCLUDE (
+        team_id, nota_final, ci_lower, ci_upper, incerteza, games_count,
+        score_colley, score_massey, score_elo_final, score_elo_mov,
+        score_trueskill, score_pagerank, score_bradley_terry, score_pca,
+        score_sos, score_consistency, score_integrado
+    );
@@ -0,0 +1,9 @@
+-- Índices de ranking_snapshots
+-- Aplicar manualmente no banco (Supabase SQL editor ou psql).
+-- CONCURRENTLY não pode rodar dentro de uma transação.
+
+-- Índice para as leituras ordenadas por data (snapshot mais recente,
+-- /ranking/snapshots, maua_snapshot_presence). Com id no índice, as consultas
+-- que só precisam de (id, created_at) fazem index-only scan já na ordem certa.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ranking_snapshots_created_at_id_idx
+    ON ranking_snapshots (created_at, id);
@@ -0,0 +1,22 @@
+-- Função RPC usada por snapshots_data/Untitled-1.py (analyze_tag_conflicts)
+-- Aplicar manualmente no banco (Supabase SQL editor ou psql).
+
+-- Tags compartilhadas por mais de um time, já agrupadas no banco: o script
+-- recebe apenas os grupos em conflito em vez da tabela de times inteira.
+CREATE OR REPLACE FUNCTION tag_conflicts()
+RETURNS TABLE (tag text, teams jsonb)
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT
+        t.tag::text,
+        jsonb_agg(
+            jsonb_build_object('id', t.id, 'slug', t.slug, 'name', t.name)
+            ORDER BY t.id
+        )
+    FROM teams t
+    WHERE t.tag IS NOT NULL AND t.tag <> ''
+    GROUP BY t.tag
+    HAVING count(*) > 1
+    ORDER BY t.tag
+$$;